@@ -14,21 +14,25 @@ import datetime
 figure_dir = '/Users/edf/repos/la100es-panel-upgrades/figs/mf/'
 output_dir = '/Users/edf/repos/la100es-panel-upgrades/data/outputs/mf/'
 sector = 'multi_family'
+rule_version = 'v1'
+cache_dir = '/Users/edf/repos/la100es-panel-upgrades/data/cache/'
+export_csv = False
+export_db = False
+export_geojson = False
 
 #%% Import Data and Context Layers
 
-mf_buildings = io.ImportBuildingPermitData(sector)
-mf_buildings = utils.CoalesceRecords(mf_buildings)
-ces4 = io.ImportCalEnviroScreenData()
-ladwp = io.ImportLadwpServiceTerritoryData()
+io.ConfigureCache(cache_dir)
+mf_buildings, ces4, ladwp = io.ImportSectorData(sector)
+io.DisposeEngine()
 mf_buildings_ces = utils.AssignDACStatus(utils.MergeCES(mf_buildings, ces4))
 mf_buildings_ces = utils.ComputeAverageUnitSize(mf_buildings_ces)
 
 #%% Implement Initial Decision Tree
 
-mf_buildings_ces = decide.AssignAsBuiltFromDecisionTree(mf_buildings_ces, sector)
-mf_buildings_ces = decide.AssignExistingFromPermit(mf_buildings_ces, sector)
-mf_buildings_ces = decide.InferExistingFromModel(mf_buildings_ces, sector)
+mf_buildings_ces = decide.AssignAsBuiltFromDecisionTree(mf_buildings_ces, sector, version = rule_version)
+mf_buildings_ces = decide.AssignExistingFromPermit(mf_buildings_ces, sector, version = rule_version)
+mf_buildings_ces = decide.InferExistingFromModel(mf_buildings_ces, sector, version = rule_version)
 mf_buildings_ces = utils.UpgradeTimeDelta(mf_buildings_ces)
 
 #%% Compute Statistics
@@ -37,25 +41,29 @@ panel_stats_ces_geo = utils.ChangeStatistics(mf_buildings_ces, ces4)
 
 #%% Generate Plots
 
-plot.CountsMap(mf_buildings, ces4, ladwp, sector, figure_dir)
-plot.AsBuiltPanelRatingsMap(mf_buildings_ces, ces4, ladwp, sector, figure_dir)
-plot.AsBuiltPanelRatingsHist(mf_buildings_ces, ces4, ladwp, sector, figure_dir)
-plot.JointDistributionPlot(mf_buildings_ces, sector, figure_dir)
-plot.AsBuiltPanelRatingsBar(mf_buildings_ces, sector, figure_dir)
-plot.PermitTimeSeries(mf_buildings_ces, sector, figure_dir)
-plot.PermitCountsBar(mf_buildings_ces, sector, figure_dir)
-plot.PermitCountsMap(mf_buildings_ces, ces4, ladwp, sector, figure_dir)
-plot.PermitCountsHistAnimation(mf_buildings_ces, figure_dir)
-plot.PermitVintageYearECDF(mf_buildings_ces, sector, figure_dir)
-plot.ExistingPanelRatingsBar(mf_buildings_ces, sector, figure_dir)
-plot.ExistingPanelRatingsChangeCountsBar(panel_stats_ces_geo, sector, figure_dir)
-plot.ExistingPanelRatingsChangeAmpsBox(panel_stats_ces_geo, sector, figure_dir)
-plot.ExistingPanelRatingsChangeAmpsScatter(panel_stats_ces_geo, sector, figure_dir)
-plot.ExistingPanelRatingsChangeAmpsHist(panel_stats_ces_geo, sector, figure_dir)
-plot.ExistingPanelRatingsHist(mf_buildings_ces, ces4, ladwp, sector, figure_dir)
-#plot.ExistingPanelRatingsChangePctMap(panel_stats_ces_geo, ces4, ladwp, figure_dir)
-plot.ExistingPanelRatingsMap(panel_stats_ces_geo, ces4, ladwp, sector, figure_dir)
-plot.AreaNormalizedComparisonKDE(mf_buildings_ces, sector, figure_dir)
+plot.BaseMapLayers(ces4, ladwp)
+
+figure_timings = plot.RenderFigures([
+    (plot.CountsMap, (panel_stats_ces_geo, ces4, ladwp, sector, figure_dir)),
+    (plot.AsBuiltPanelRatingsMap, (panel_stats_ces_geo, ces4, ladwp, sector, figure_dir)),
+    (plot.AsBuiltPanelRatingsHist, (mf_buildings_ces, ces4, ladwp, sector, figure_dir)),
+    (plot.JointDistributionPlot, (mf_buildings_ces, sector, figure_dir)),
+    (plot.AsBuiltPanelRatingsBar, (mf_buildings_ces, sector, figure_dir)),
+    (plot.PermitTimeSeries, (mf_buildings_ces, sector, figure_dir)),
+    (plot.PermitCountsBar, (mf_buildings_ces, sector, figure_dir)),
+    (plot.PermitCountsMap, (panel_stats_ces_geo, ces4, ladwp, sector, figure_dir)),
+    (plot.PermitCountsHistAnimation, (mf_buildings_ces, figure_dir)),
+    (plot.PermitVintageYearECDF, (mf_buildings_ces, sector, figure_dir)),
+    (plot.ExistingPanelRatingsBar, (mf_buildings_ces, sector, figure_dir)),
+    (plot.ExistingPanelRatingsChangeCountsBar, (panel_stats_ces_geo, sector, figure_dir)),
+    (plot.ExistingPanelRatingsChangeAmpsBox, (panel_stats_ces_geo, sector, figure_dir)),
+    (plot.ExistingPanelRatingsChangeAmpsScatter, (panel_stats_ces_geo, sector, figure_dir)),
+    (plot.ExistingPanelRatingsChangeAmpsHist, (panel_stats_ces_geo, sector, figure_dir)),
+    (plot.ExistingPanelRatingsHist, (mf_buildings_ces, ces4, ladwp, sector, figure_dir)),
+    #(plot.ExistingPanelRatingsChangePctMap, (panel_stats_ces_geo, ces4, ladwp, figure_dir)),
+    (plot.ExistingPanelRatingsMap, (panel_stats_ces_geo, ces4, ladwp, sector, figure_dir)),
+    (plot.AreaNormalizedComparisonKDE, (mf_buildings_ces, sector, figure_dir)),
+    ])
 
 #%% Print Diagnostics
 
@@ -67,15 +75,17 @@ utils.ExistingPanelRatingsDiagnostics(mf_buildings_ces, sector)
 
 final = utils.SortColumns(mf_buildings_ces, sector)
 ts = str(datetime.datetime.now())
-final.to_pickle(output_dir + 'la100es_mf_electricity_service_panel_capacity_analysis.pk')
-final.to_csv(output_dir + 'la100es_mf_electricity_service_panel_capacity_analysis_'+ ts[:10] + '.csv')
+io.WriteBuildingsGeoParquet(final, output_dir + 'la100es_mf_electricity_service_panel_capacity_analysis.parquet')
+
+if export_db == True:
+    io.ExportFrame(final, 'la100es_mf_electricity_service_panel_capacity_analysis')
+
+if export_csv == True:
+    final.to_csv(output_dir + 'la100es_mf_electricity_service_panel_capacity_analysis_'+ ts[:10] + '.csv')
 
 #%% Output Geospatial Version
 
-final_gdf = gpd.GeoDataFrame(final,
-    geometry=gpd.GeoSeries.from_wkb(final['centroid'], index=None, crs='EPSG:3310'),
-    crs='EPSG:3310')
-final_gdf.drop(columns= ['centroid'], inplace = True)
+if export_geojson == True:
 
-path = output_dir + 'la100es_mf_electricity_service_panel_capacity_analysis_' + ts[:10] + '.geojson'
-final_gdf.to_file(path, driver = 'GeoJSON', na = 'null')
+    path = output_dir + 'la100es_mf_electricity_service_panel_capacity_analysis_' + ts[:10] + '.geojson'
+    final.to_file(path, driver = 'GeoJSON', na = 'null')
@@ -8,15 +8,16 @@ import numpy as np
 #%% Read Single Family Data
 
 sf_data_dir = '/Users/edf/repos/la100es-panel-upgrades/data/outputs/sf/'
-sf_data = pd.read_pickle(sf_data_dir + 'la100es_sf_electricity_service_panel_capacity_analysis.pk')
+sf_cols = ['apn', 'dac_status', 'building_sqft', 'year_built', 'panel_size_existing', 'permitted_panel_upgrade', 'inferred_panel_upgrade']
+sf_data = pd.read_parquet(sf_data_dir + 'la100es_sf_electricity_service_panel_capacity_analysis.parquet', columns = sf_cols)
 
 #%% SF Average Size
 
-sf_data[['dac_status','building_sqft']].groupby('dac_status').agg(['mean','count'])
+sf_data[['dac_status','building_sqft']].groupby('dac_status', observed = True).agg(['mean','count'])
 
 #%% Average Vintage Year
 
-sf_data[['dac_status','year_built']].groupby('dac_status').agg(['mean','count'])
+sf_data[['dac_status','year_built']].groupby('dac_status', observed = True).agg(['mean','count'])
 
 #%% SF Bin Ranged Averages
 
@@ -24,29 +25,30 @@ sf_data.groupby(pd.cut(sf_data['year_built'], pd.to_datetime(np.arange(1830, 202
 
 #%% Counts by Panel Size Rating
 
-sf_data.groupby(['panel_size_existing', 'dac_status'])['apn'].agg('count').unstack().to_csv('/Users/edf/Desktop/scratch5.csv')
+sf_data.groupby(['panel_size_existing', 'dac_status'], observed = True)['apn'].agg('count').unstack().to_csv('/Users/edf/Desktop/scratch5.csv')
 
 #%% SF Counts
 
-sf_data.groupby('dac_status')['permitted_panel_upgrade'].agg('sum') / sf_data.groupby('dac_status')['apn'].agg('count')
-sf_data.groupby('dac_status')['inferred_panel_upgrade'].agg('sum') / sf_data.groupby('dac_status')['apn'].agg('count')
+sf_data.groupby('dac_status', observed = True)['permitted_panel_upgrade'].agg('sum') / sf_data.groupby('dac_status', observed = True)['apn'].agg('count')
+sf_data.groupby('dac_status', observed = True)['inferred_panel_upgrade'].agg('sum') / sf_data.groupby('dac_status', observed = True)['apn'].agg('count')
 
 #%% Read Multi_Family Data
 
 mf_data_dir = '/Users/edf/repos/la100es-panel-upgrades/data/outputs/mf/'
-mf_data = pd.read_pickle(mf_data_dir + 'la100es_mf_electricity_service_panel_capacity_analysis.pk')
+mf_cols = ['apn', 'dac_status', 'building_sqft', 'units', 'avg_unit_sqft', 'year_built', 'panel_size_existing', 'permitted_panel_upgrade', 'inferred_panel_upgrade']
+mf_data = pd.read_parquet(mf_data_dir + 'la100es_mf_electricity_service_panel_capacity_analysis.parquet', columns = mf_cols)
 
 #%% MF Average Size
 
-mf_data[['dac_status','building_sqft','units']].groupby('dac_status').agg(['mean','count'])
+mf_data[['dac_status','building_sqft','units']].groupby('dac_status', observed = True).agg(['mean','count'])
 
 #%% MF Bin Ranged Averages
 
 mf_data.groupby(pd.cut(mf_data['year_built'], pd.to_datetime(np.arange(1850, 2022, 10), format = '%Y'))).agg(['count','mean'])['building_sqft'].to_csv('/Users/edf/Desktop/scratch1.csv')
 mf_data.groupby(pd.cut(mf_data['year_built'], pd.to_datetime(np.arange(1850, 2022, 10), format = '%Y'))).agg(['mean'])['units'].to_csv('/Users/edf/Desktop/scratch2.csv')
 mf_data.groupby(pd.cut(mf_data['year_built'], pd.to_datetime(np.arange(1850, 2022, 10), format = '%Y'))).agg(['mean'])['avg_unit_sqft'].to_csv('/Users/edf/Desktop/scratch3.csv')
-mf_data.groupby(['dac_status', 'panel_size_existing'])['panel_size_existing'].agg('count').to_csv('/Users/edf/Desktop/scratch4.csv')
-mf_data.groupby(['dac_status', 'panel_size_existing'])['units'].agg('sum').to_csv('/Users/edf/Desktop/scratch5.csv')
+mf_data.groupby(['dac_status', 'panel_size_existing'], observed = True)['panel_size_existing'].agg('count').to_csv('/Users/edf/Desktop/scratch4.csv')
+mf_data.groupby(['dac_status', 'panel_size_existing'], observed = True)['units'].agg('sum').to_csv('/Users/edf/Desktop/scratch5.csv')
 
 # %% SF Stats Data
 
@@ -4,282 +4,227 @@ import pandas as pd
 import geopandas as gpd
 import numpy as np
 import pickle
-from itertools import product
+import re
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from statsmodels.distributions.empirical_distribution import ECDF
+from . import rules as rules_tables
+from . import utils
+
+#%% Look Up Panel Sizes from a Vintage by Size Rating Table
+
+def LookupPanelSizes(years, sizes, vintage_edges, size_edges, panel_sizes):
+    '''Function to look up panel size ratings by digitizing construction
+    vintage years and building sizes once and indexing a 2-D (vintage bins
+    x size bins) table of panel ratings. If size_edges is None the table
+    is indexed by vintage alone. Properties with missing vintages, missing
+    sizes or negative sizes are assigned NaN.'''
+
+    years = np.asarray(years, dtype = float)
+    table = np.asarray(panel_sizes, dtype = float)
+
+    if table.ndim == 1:
+        table = table[:, np.newaxis]
+
+    vintage_bin = np.digitize(years, vintage_edges)
+    valid = ~np.isnan(years)
+
+    if size_edges is None:
+        size_bin = np.zeros(years.shape[0], dtype = int)
+    else:
+        sizes = np.asarray(sizes, dtype = float)
+        size_bin = np.digitize(sizes, size_edges) - 1
+        valid = valid & ~np.isnan(sizes) & (size_bin >= 0)
+
+    panel_size = np.full(years.shape[0], np.nan)
+    panel_size[valid] = table[vintage_bin[valid], size_bin[valid]]
+
+    return panel_size
 
 #%% Implement Decision Tree Function
 
-def AssignAsBuiltFromDecisionTree(buildings_ces, sector):
+def AssignAsBuiltFromDecisionTree(buildings_ces, sector, version = 'v1'):
     '''Function to assign as-built panel size ratings to residential
-    buildings using a vintage year and square footage based decision tree'''
+    buildings using a vintage year and square footage based decision tree.
+    The decision tree is read from the versioned rule table for the sector.'''
 
-    if sector == 'single_family':
-        size_col = 'building_sqft'
-    elif sector == 'multi_family':
-        size_col = 'avg_unit_sqft'
-    else:
+    if sector not in ['single_family', 'multi_family']:
         raise Exception("Sector must be either 'single_family' or 'multi_family'")
 
-    if sector == 'single_family':
-
-        vintage_pre_1883 = buildings_ces['year_built'].dt.year < 1883
-        vintage_1883_1950 = (buildings_ces['year_built'].dt.year >= 1883) & (buildings_ces['year_built'].dt.year < 1950)
-        vintage_1950_1978 = (buildings_ces['year_built'].dt.year >= 1950) & (buildings_ces['year_built'].dt.year < 1978)
-        vintage_1978_2010 = (buildings_ces['year_built'].dt.year >= 1978) & (buildings_ces['year_built'].dt.year < 2010)
-        vintage_post_2010 = buildings_ces['year_built'].dt.year >= 2010
-
-        size_minus_1k = (buildings_ces[size_col] >= 0) & (buildings_ces[size_col] < 1000)
-        size_1k_2k = (buildings_ces[size_col] >= 1000) & (buildings_ces[size_col] < 2000)
-        size_2k_3k = (buildings_ces[size_col] >= 2000) & (buildings_ces[size_col] < 3000)
-        size_3k_4k = (buildings_ces[size_col] >= 3000) & (buildings_ces[size_col] < 4000)
-        size_4k_5k = (buildings_ces[size_col] >= 4000) & (buildings_ces[size_col] < 5000)
-        size_5k_8k = (buildings_ces[size_col] >= 5000) & (buildings_ces[size_col] < 8000)
-        size_8k_10k = (buildings_ces[size_col] >= 8000) & (buildings_ces[size_col] < 10000)
-        size_10k_20k = (buildings_ces[size_col] >= 10000) & (buildings_ces[size_col] < 20000)
-        size_20k_plus = (buildings_ces[size_col] >= 20000)
-
-        vintage_names = [   'vintage_pre_1883',
-                            'vintage_1883_1950',
-                            'vintage_1950_1978',
-                            'vintage_1978_2010',
-                            'vintage_post_2010']
-
-        size_names = [      'size_minus_1k',
-                            'size_1k_2k',
-                            'size_2k_3k',
-                            'size_3k_4k',
-                            'size_4k_5k',
-                            'size_5k_8k',
-                            'size_8k_10k'
-                            'size_10k_20k',
-                            'size_20k_plus']
-
-        vintage_bins = [    vintage_pre_1883,
-                            vintage_1883_1950,
-                            vintage_1950_1978,
-                            vintage_1978_2010,
-                            vintage_post_2010]
-
-        size_bins = [       size_minus_1k,
-                            size_1k_2k,
-                            size_2k_3k,
-                            size_3k_4k,
-                            size_4k_5k,
-                            size_5k_8k,
-                            size_8k_10k,
-                            size_10k_20k,
-                            size_20k_plus]
-
-        names = list(map(list, product(vintage_names, size_names)))
-        combs = list(map(list, product(vintage_bins, size_bins)))
-
-        panel_sizes = [ 0.,         # [['vintage_pre_1883', 'size_minus_1k'],
-                        0.,         # ['vintage_pre_1883', 'size_1k_2k'],
-                        0.,         # ['vintage_pre_1883', 'size_2k_3k'],
-                        0.,         # ['vintage_pre_1883', 'size_3k_4k'],
-                        0.,         # ['vintage_pre_1883', 'size_4k_5k'],
-                        0.,         # ['vintage_pre_1883', 'size_5k_8k'],
-                        0.,         # ['vintage_pre_1883', 'size_8k_10k']
-                        0.,         # ['vintage_pre_1883', 'size_10k_20k'],
-                        0.,         # ['vintage_pre_1883', 'size_20k_plus'],
-                        30.,        # ['vintage_1883_1950', 'size_minus_1k'],
-                        40.,        # ['vintage_1883_1950', 'size_1k_2k'],
-                        60.,        # ['vintage_1883_1950', 'size_2k_3k'],
-                        100.,       # ['vintage_1883_1950', 'size_3k_4k'],
-                        125.,       # ['vintage_1883_1950', 'size_4k_5k'],
-                        150.,       # ['vintage_1883_1950', 'size_5k_8k'],
-                        200.,       # ['vintage_1883_1950', 'size_8k_10k']
-                        320.,       # ['vintage_1883_1950', 'size_10k_20k'],
-                        400.,       # ['vintage_1883_1950', 'size_20k_plus'],
-                        30.,        # ['vintage_1950_1978', 'size_minus_1k'],
-                        60.,        # ['vintage_1950_1978', 'size_1k_2k'],
-                        100.,       # ['vintage_1950_1978', 'size_2k_3k'],
-                        125.,       # ['vintage_1950_1978', 'size_3k_4k'],
-                        150.,       # ['vintage_1950_1978', 'size_4k_5k'],
-                        200.,       # ['vintage_1950_1978', 'size_5k_8k'],
-                        320.,       # ['vintage_1950_1978', 'size_8k_10k']
-                        400.,       # ['vintage_1950_1978', 'size_10k_20k'],
-                        600.,       # ['vintage_1950_1978', 'size_20k_plus'],
-                        100.,       # ['vintage_1978_2010', 'size_minus_1k'],
-                        125.,       # ['vintage_1978_2010', 'size_1k_2k'],
-                        150.,       # ['vintage_1978_2010', 'size_2k_3k'],
-                        200.,       # ['vintage_1978_2010', 'size_3k_4k'],
-                        225.,       # ['vintage_1978_2010', 'size_4k_5k']
-                        320.,       # ['vintage_1978_2010', 'size_5k_8k'],
-                        400.,       # ['vintage_1978_2010', 'size_8k_10k']
-                        600.,       # ['vintage_1978_2010', 'size_10k_20k']
-                        800.,       # ['vintage_1978_2010', 'size_20k_plus']
-                        150.,       # ['vintage_post_2010', 'size_minus_1k'],
-                        200.,       # ['vintage_post_2010', 'size_1k_2k'],
-                        225.,       # ['vintage_post_2010', 'size_2k_3k'],
-                        320.,       # ['vintage_post_2010', 'size_3k_4k'],
-                        400.,       # ['vintage_post_2010', 'size_4k_5k']
-                        600.,       # ['vintage_post_2010', 'size_5k_8k'],
-                        800.,       # ['vintage_post_2010', 'size_8k_10k']
-                        1000.,      # ['vintage_post_2010', 'size_10k_20k']
-                        1200.]      # ['vintage_post_2010', 'size_20k_plus']]
-
-    elif sector == 'multi_family':
-
-        vintage_pre_1883 = buildings_ces['year_built'].dt.year < 1883
-        vintage_1883_1950 = (buildings_ces['year_built'].dt.year >= 1883) & (buildings_ces['year_built'].dt.year < 1950)
-        vintage_1950_1978 = (buildings_ces['year_built'].dt.year >= 1950) & (buildings_ces['year_built'].dt.year < 1978)
-        vintage_1978_2010 = (buildings_ces['year_built'].dt.year >= 1978) & (buildings_ces['year_built'].dt.year < 2010)
-        vintage_post_2010 = buildings_ces['year_built'].dt.year >= 2010
-
-        vintage_names = [   'vintage_pre_1883',
-                            'vintage_1883_1950',
-                            'vintage_1950_1978',
-                            'vintage_1978_2010',
-                            'vintage_post_2010']
-
-        vintage_bins = [    vintage_pre_1883,
-                            vintage_1883_1950,
-                            vintage_1950_1978,
-                            vintage_1978_2010,
-                            vintage_post_2010 ]
-
-        names = vintage_names
-        combs = vintage_bins
-
-        panel_sizes = [ 0.,      # 'vintage_pre_1883',
-                        40.,     # 'vintage_1883_1950'
-                        60.,     # 'vintage_1950_1978'
-                        90.,     # 'vintage_1978_2010'
-                        150. ]   # 'vintage_post_2010'
-
-    buildings_ces['panel_size_as_built'] = np.nan
-
-    for i in range(len(combs)):
-
-        if sector == 'single_family':
-
-            buildings_ces.loc[(combs[i][0] & combs[i][1]),'panel_size_as_built'] = panel_sizes[i]
-
-        elif sector == 'multi_family':
-
-            buildings_ces.loc[combs[i],'panel_size_as_built'] = panel_sizes[i]
+    rules = rules_tables.LoadRuleTable(sector, version)
+
+    # Multi-Family Ratings Depend Upon Vintage Only
+    if rules['size_edges'] is None:
+        sizes = None
+    else:
+        sizes = buildings_ces[rules['size_column']]
+
+    buildings_ces['panel_size_as_built'] = LookupPanelSizes(buildings_ces['year_built'].dt.year,
+                                                            sizes,
+                                                            rules['vintage_edges'],
+                                                            rules['size_edges'],
+                                                            rules['panel_sizes'])
 
     buildings_ces.reset_index(inplace = True, drop = True)
+    buildings_ces['rule_table'] = rules_tables.RuleTableLabel(rules)
+
+    buildings_ces = utils.ApplyBuildingsSchema(buildings_ces)
 
     return buildings_ces
 
+#%% Compile Permit Description Pattern
+
+@lru_cache(maxsize = None)
+def PermitPattern(amps):
+    '''Function to compile a single case-insensitive regular expression which
+    matches explicit amperage tokens (e.g. ' 200' or a leading '200') and the
+    solar, ev and ac equipment keywords in permit work descriptions'''
+
+    amps_tokens = '|'.join(['{:.0f}'.format(a) for a in sorted(amps, reverse = True)])
+
+    pattern = (r'(?:^|\s)(?P<amps>' + amps_tokens + r')(?!\d)'
+               r'|(?P<solar>\ssolar|\spv|photovoltaic)'
+               r'|(?P<ev>\sev|\scharger)'
+               r'|(?P<ac>\sac|\sa/c)')
+
+    return re.compile(pattern, re.IGNORECASE)
+
+#%% Parse Permit Descriptions
+
+def ParsePermitDescriptions(descriptions, amps):
+    '''Function to parse permit work descriptions in a single pass with one
+    compiled regular expression. Returns a compact table aligned with the
+    input which contains the largest amperage token found ('amps', 0 if
+    none), a boolean column for each amperage token ('amps_100', ...) and
+    boolean solar, ev and ac equipment flags.'''
+
+    matches = descriptions.astype('object').str.extractall(PermitPattern(tuple(amps)))
+    rows = matches.index.get_level_values(0)
+
+    permits = pd.DataFrame(index = descriptions.index)
+
+    tokens = pd.to_numeric(matches['amps']).to_numpy(dtype = float)
+    found = ~np.isnan(tokens)
+    largest = pd.Series(tokens[found], index = rows[found]).groupby(level = 0).max()
+    permits['amps'] = largest.reindex(descriptions.index, fill_value = 0).astype(np.uint16)
+
+    for a in amps:
+        hit = rows[tokens == a].unique()
+        permits['amps_{:.0f}'.format(a)] = descriptions.index.isin(hit)
+
+    for flag in ['solar', 'ev', 'ac']:
+        hit = rows[matches[flag].notna().to_numpy()].unique()
+        permits[flag] = descriptions.index.isin(hit)
+
+    return permits
+
 #%% Assign Existing Panel Size Based Upon Permit Description
 
-def AssignExistingFromPermit(buildings_ces, sector):
+def AssignExistingFromPermit(buildings_ces, sector, version = 'v1'):
     '''Use work description from permit data to assign existing panel rating'''
 
-    # Peform Filtering Assignment
+    rules = rules_tables.LoadRuleTable(sector, version)
 
-    buildings_ces['panel_size_existing'] = buildings_ces['panel_size_as_built']
+    # Parse Amperage Tokens and Equipment Flags in a Single Pass
 
-    if sector == 'single_family':
-
-        # Find Locations with Upgrades of Different Size
-
-        pu_100 = (buildings_ces['permit_description'].str.contains(' 100')) | (buildings_ces['permit_description'].str.startswith('100'))
-        pu_125 = (buildings_ces['permit_description'].str.contains(' 125')) | (buildings_ces['permit_description'].str.startswith('120'))
-        pu_150 = (buildings_ces['permit_description'].str.contains(' 150')) | (buildings_ces['permit_description'].str.startswith('150'))
-        pu_200 = (buildings_ces['permit_description'].str.contains(' 200')) | (buildings_ces['permit_description'].str.startswith('200'))
-        pu_225 = (buildings_ces['permit_description'].str.contains(' 225')) | (buildings_ces['permit_description'].str.startswith('225'))
-        pu_320 = (buildings_ces['permit_description'].str.contains(' 320')) | (buildings_ces['permit_description'].str.startswith('320'))
-        pu_400 = (buildings_ces['permit_description'].str.contains(' 400')) | (buildings_ces['permit_description'].str.startswith('400'))
-        pu_600 = (buildings_ces['permit_description'].str.contains(' 600')) | (buildings_ces['permit_description'].str.startswith('600'))
-
-        pu_solar = (buildings_ces['permit_description'].str.contains(' solar', case = False)) | (buildings_ces['permit_description'].str.contains(' pv', case = False))  | (buildings_ces['permit_description'].str.contains('photovoltaic', case = False))
-        pu_ev = (buildings_ces['permit_description'].str.contains(' ev', case = False)) | (buildings_ces['permit_description'].str.contains(' charger', case = False))
-        pu_ac = (buildings_ces['permit_description'].str.contains(' ac', case = False)) | (buildings_ces['permit_description'].str.contains(" a/c", case = False))
-
-        pu_any = buildings_ces['panel_related_permit'] == True
-        pu_other = pu_any & ~(pu_100 | pu_125 | pu_150 | pu_200 | pu_225 | pu_320 | pu_400 | pu_600)
-
-        upgrade_scale = [   0.,
-                            30.,
-                            40.,
-                            60.,
-                            100.,
-                            125.,
-                            150.,
-                            200.,
-                            225.,
-                            320.,
-                            400.,
-                            600.,
-                            800.,
-                            1000.,
-                            1200.,
-                            1400.]
-
-    elif sector == 'multi_family':
-
-        # Find Locations with Upgrades of Different Size
-
-        pu_100 = (buildings_ces['permit_description'].str.contains(' 100')) | (buildings_ces['permit_description'].str.startswith('100'))
-        pu_125 = (buildings_ces['permit_description'].str.contains(' 125')) | (buildings_ces['permit_description'].str.startswith('120'))
-        pu_150 = (buildings_ces['permit_description'].str.contains(' 150')) | (buildings_ces['permit_description'].str.startswith('150'))
-        pu_200 = (buildings_ces['permit_description'].str.contains(' 200')) | (buildings_ces['permit_description'].str.startswith('200'))
-
-        pu_solar = (buildings_ces['permit_description'].str.contains(' solar', case = False)) | (buildings_ces['permit_description'].str.contains(' pv', case = False))  | (buildings_ces['permit_description'].str.contains('photovoltaic', case = False))
-        pu_ev = (buildings_ces['permit_description'].str.contains(' ev', case = False)) | (buildings_ces['permit_description'].str.contains(' charger', case = False))
-        pu_ac = (buildings_ces['permit_description'].str.contains(' ac', case = False)) | (buildings_ces['permit_description'].str.contains(" a/c", case = False))
-
-        pu_any = buildings_ces['panel_related_permit'] == True
-        pu_other = pu_any & ~(pu_100 | pu_125 | pu_150 | pu_200 )
-
-        upgrade_scale = [   0.,
-                            40.,
-                            60.,
-                            90.,
-                            100.,
-                            150.,
-                            200.]
-
-    ind_dict = {100.:pu_100,
-                125.:pu_125,
-                150.:pu_150,
-                200.:pu_200}
+    permits = ParsePermitDescriptions(buildings_ces['permit_description'], rules['permit_explicit_amps'])
+
+    # Peform Filtering Assignment
 
+    buildings_ces['panel_size_existing'] = buildings_ces['panel_size_as_built']
     buildings_ces['permitted_panel_upgrade'] = False
 
-    for k, v in ind_dict.items():
+    # Find Locations with Upgrades of Different Size
+
+    for k in rules['permit_assigned_amps']:
 
-        v[v.isna()] = False
+        v = permits['amps_{:.0f}'.format(k)]
         proposed = buildings_ces.loc[v,'panel_size_as_built']
         change_ind = proposed < k
         proposed.loc[change_ind] = k
         buildings_ces.loc[proposed.index,'panel_size_existing'] = proposed
 
-    pu_other[pu_other.isna()] = False
-    proposed = buildings_ces.loc[pu_other, 'panel_size_as_built']
-
-    for p in proposed.items():
-        c = None
-        if np.isnan(p[1]):
-            c = 100.
-        else:
-            c = p[1]
-        k = upgrade_scale.index(c)
-        upgrade = upgrade_scale[k+1]
-        if upgrade < 200.:
-            if sector == 'single_family':
-                upgrade = 200.
-            elif sector == 'multi_family':
-                upgrade = 150.
-        proposed.loc[p[0]] = upgrade
-
-    buildings_ces.loc[proposed.index, 'panel_size_existing'] = proposed
+    explicit_cols = ['amps_{:.0f}'.format(a) for a in rules['permit_explicit_amps']]
+
+    pu_any = buildings_ces['panel_related_permit'] == True
+    pu_other = pu_any & ~permits[explicit_cols].any(axis = 1)
+
+    # Step Other Panel Related Permits Up to the Next Tier of the Upgrade Scale
+    # (Unknown As-Built Ratings are Treated as 100 Amps)
+
+    current = buildings_ces.loc[pu_other, 'panel_size_as_built'].fillna(100.)
+    upgrade = NextUpgradeTier(current, rules['permit_upgrade_scale'])
+    upgrade = np.maximum(upgrade, rules['permit_upgrade_floor'])
+    buildings_ces.loc[pu_other, 'panel_size_existing'] = upgrade
+
     upgrade_ind = buildings_ces['panel_size_existing'] > buildings_ces['panel_size_as_built']
     buildings_ces.loc[upgrade_ind, 'permitted_panel_upgrade'] = True
+    buildings_ces['rule_table'] = rules_tables.RuleTableLabel(rules)
+
+    buildings_ces = utils.ApplyBuildingsSchema(buildings_ces)
 
     return buildings_ces
 
-#%% Infer Previous Year Upgrades Based Upon Permitted Data ECDF
+#%% Step Panel Sizes Up to the Next Tier of an Upgrade Scale
 
-def InferExistingFromModel(buildings_ces, sector):
-    '''Function to infer the existing panel size for a buildng that did not
-    receive any previous permitted work. The inference model is based upon
-    the empirical ECDF which relates the age of the home to the probability
-    of permitted work by DAC status.'''
+def NextUpgradeTier(panel_sizes, upgrade_scale):
+    '''Function to step an array of panel size ratings up to the next tier
+    of an ordinally ranked upgrade scale. The as-built -> next-tier lookup
+    array is precomputed once and indexed with np.searchsorted. Missing
+    panel sizes are returned as NaN and sizes not found on the scale raise
+    an exception.'''
+
+    scale = np.asarray(upgrade_scale, dtype = float)
+    next_tier = np.append(scale[1:], np.nan)
+
+    sizes = np.asarray(panel_sizes, dtype = float)
+    missing = np.isnan(sizes)
+
+    level = np.searchsorted(scale, sizes)
+    level = np.minimum(level, scale.shape[0] - 1)
+    off_scale = ~missing & (scale[level] != sizes)
+
+    if off_scale.any():
+        raise Exception('Panel sizes {} are not on the upgrade scale'.format(np.unique(sizes[off_scale])))
+
+    stepped = next_tier[level]
+    stepped[missing] = np.nan
+
+    return stepped
+
+#%% Draw Upgrade Decisions from Upgrade Probabilities
+
+def DrawUpgradeDecisions(probabilities, rng = None):
+    '''Function to draw a boolean upgrade decision for every property from
+    its upgrade probability in a single vectorized call. If rng is a numpy
+    Generator the decisions are drawn from it. If rng is None the decisions
+    are drawn from the legacy global numpy stream and are identical to those
+    produced by calling np.random.choice([False, True], p = [1-p, p]) once
+    per property, so that previously published outputs can be regenerated
+    after seeding with np.random.seed.'''
+
+    pr = np.asarray(probabilities, dtype = float)
+
+    if rng is None:
+
+        # np.random.choice normalizes the cdf [1-p, 1] and returns True
+        # whenever its uniform draw falls at or above the first entry
+        threshold = (1.0 - pr) / ((1.0 - pr) + pr)
+        upgrade = np.random.random_sample(pr.shape[0]) >= threshold
+
+    else:
+
+        upgrade = rng.random(pr.shape[0]) < pr
+
+    return upgrade
+
+#%% Extract Upgrade Inference Cohorts
+
+def InferenceCohorts(buildings_ces):
+    '''Function to extract the current property ages, the DAC and Non-DAC
+    inference cohorts of non-permitted properties, and the ages at which
+    permitted properties received their upgrades (used to fit the ECDFs)'''
 
     # Filter Properties with no construction vintage data
     nan_ind = ~buildings_ces.loc[:,'year_built'].isna()
@@ -303,9 +248,30 @@ def InferExistingFromModel(buildings_ces, sector):
     # Compute the Age of the Properties in the Year in Which Permits were Issued (if any)
     permit_age = current_age - (2022 - permit_issue_year)
 
+    dac_permit_age = permit_age.loc[nan_ind & dac_ind & permit_ind]
+    non_dac_permit_age = permit_age.loc[nan_ind & non_dac_ind & permit_ind]
+
+    # Filter the DAC and Non-DAC Inference Groups of Non-Permitted Properties
+    dac_cohort = nan_ind & dac_ind & ~permit_ind
+    non_dac_cohort = nan_ind & non_dac_ind & ~permit_ind
+
+    return current_age, dac_cohort, non_dac_cohort, dac_permit_age, non_dac_permit_age
+
+#%% Infer Previous Year Upgrades Based Upon Permitted Data ECDF
+
+def InferExistingFromModel(buildings_ces, sector, rng = None, version = 'v1'):
+    '''Function to infer the existing panel size for a buildng that did not
+    receive any previous permitted work. The inference model is based upon
+    the empirical ECDF which relates the age of the home to the probability
+    of permitted work by DAC status. Upgrade decisions are drawn from rng
+    (a numpy Generator or seed) if provided, otherwise the legacy global
+    stream seeded with 12345678 is reproduced.'''
+
+    current_age, dac_cohort, non_dac_cohort, dac_permit_age, non_dac_permit_age = InferenceCohorts(buildings_ces)
+
     # Generate ECDFS Based Upon the Age of Properties at the time Their Permits Were Issued for Permitted Properties
-    dac_ecdf = ECDF(permit_age.loc[nan_ind & dac_ind & permit_ind])
-    non_dac_ecdf = ECDF(permit_age.loc[nan_ind & non_dac_ind & permit_ind])
+    dac_ecdf = ECDF(dac_permit_age)
+    non_dac_ecdf = ECDF(non_dac_permit_age)
 
     # Output DAC ECDF to File for LBNL
     with open('/Users/edf/repos/la100es-panel-upgrades/data/ecdfs/{}_dac_ecdf.pkl'.format(sector), 'wb') as handle:
@@ -315,97 +281,188 @@ def InferExistingFromModel(buildings_ces, sector):
     with open('/Users/edf/repos/la100es-panel-upgrades/data/ecdfs/{}_non_dac_ecdf.pkl'.format(sector), 'wb') as handle:
         pickle.dump(non_dac_ecdf, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
-    # Seed the Random Number Generator to Create Deterministic Outputs
-    rs = 12345678
-    np.random.seed(rs)
+    # Output the Probability of an Upgrade Based upon the DAC-ECDF
+    dac_y = dac_ecdf(current_age.loc[dac_cohort])
 
-    # Extract the Current Ages of the DAC Inference Group of Non-Permitted Properties
-    dac_x = current_age.loc[(nan_ind & dac_ind & ~permit_ind)]
+    # Output the Probability of an Upgrade Based upon the non-DAC-ECDF
+    non_dac_y = non_dac_ecdf(current_age.loc[non_dac_cohort])
 
-    # Output the Probability of an Upgrade Based upon the DAC-ECDF
-    dac_y = dac_ecdf(dac_x)
-    dac_upgrade_list = []
+    # Seed the Legacy Global Random Number Generator to Create Deterministic Outputs
+    if rng is None:
+        rs = 12345678
+        np.random.seed(rs)
+    else:
+        rng = np.random.default_rng(rng)
 
-    # Infer Upgrade based Upon Pseudo-Random Choice Using the Output Probability
-    for pr in dac_y:
-        dac_upgrade_list.append(np.random.choice(np.array([False, True]), size = 1, p = [1.0-pr, pr])[0])
+    # Infer Upgrades for Both Cohorts in One Draw Using the Output Probabilities
+    upgrade = DrawUpgradeDecisions(np.concatenate([dac_y, non_dac_y]), rng)
+    dac_upgrade = upgrade[:dac_y.shape[0]]
+    non_dac_upgrade = upgrade[dac_y.shape[0]:]
 
-    dac_x = dac_x.to_frame()
-    dac_x['previous_upgrade'] = dac_upgrade_list
+    # Assess Upgrades for DAC and Non-DAC cohorts
+    rules = rules_tables.LoadRuleTable(sector, version)
+    upgrade_scale = rules['inference_upgrade_scale']
 
-    # Extract the Current Ages of the non-DAC Inference Group of Non-Permitted Properties
-    non_dac_x = current_age.loc[(nan_ind & non_dac_ind & ~permit_ind)]
+    # Combine Cohort Decisions into a Single Frame Aligned Mask
+    cohort = (dac_cohort | non_dac_cohort).to_numpy()
+    previous_upgrade = np.zeros(buildings_ces.shape[0], dtype = bool)
+    previous_upgrade[dac_cohort.to_numpy()] = dac_upgrade
+    previous_upgrade[non_dac_cohort.to_numpy()] = non_dac_upgrade
 
-    # Output the Probability of an Upgrade Based upon the non-DAC-ECDF
-    non_dac_y = non_dac_ecdf(non_dac_x)
-    non_dac_upgrade_list = []
+    # Step Up Inferred Upgrades in a Single Pass
+    as_built = buildings_ces['panel_size_as_built'].to_numpy(dtype = float)
+    stepped = NextUpgradeTier(as_built[previous_upgrade], upgrade_scale)
+
+    inferred = previous_upgrade.copy()
+    inferred[previous_upgrade] = ~np.isnan(stepped)
 
-    # Infer Upgrade based Upon Pseudo-Random Choice Using the Output Probability
-    for pr in non_dac_y:
-        non_dac_upgrade_list.append(np.random.choice(np.array([False, True]), size = 1, p = [1.0-pr, pr])[0])
+    existing = buildings_ces['panel_size_existing'].to_numpy(dtype = float, copy = True)
+    existing[cohort] = as_built[cohort]
+    existing[inferred] = stepped[~np.isnan(stepped)]
 
-    non_dac_x = non_dac_x.to_frame()
-    non_dac_x['previous_upgrade'] = non_dac_upgrade_list
+    buildings_ces['panel_size_existing'] = existing
+    buildings_ces['inferred_panel_upgrade'] = inferred
+    buildings_ces['panel_upgrade'] = buildings_ces.loc[:,['permitted_panel_upgrade','inferred_panel_upgrade']].any(axis = 1)
+    buildings_ces['rule_table'] = rules_tables.RuleTableLabel(rules)
 
-    # Loop Through and Assess Upgrades for DAC and Non-DAC cohorts
-    upgrade_scale = []
+    buildings_ces = utils.ApplyBuildingsSchema(buildings_ces)
 
-    if sector == 'single_family':
+    return buildings_ces
 
-        upgrade_scale = [   0.,
-                            30.,
-                            40.,
-                            60.,
-                            100.,
-                            125.,
-                            150.,
-                            200.,
-                            225.,
-                            320.,
-                            400.,
-                            600.,
-                            800.,
-                            1000.,
-                            1200.,
-                            1400.]
+#%% Monte Carlo Ensemble Worker Functions
 
-    elif sector == 'multi_family':
+ensemble_state = {}
 
-        upgrade_scale = [   0.,
-                            40.,
-                            60.,
-                            90.,
-                            150.,
-                            200.]
+def EnsembleWorkerInit(ages, dac, as_built, tracts, n_tracts, dac_permit_age, non_dac_permit_age, upgrade_scale):
+    '''Function to initialize an ensemble worker process with the compact
+    cohort arrays. The upgrade probabilities and stepped panel sizes are
+    computed once per worker and reused for every realization.'''
 
-    # DAC Loop
-    buildings_ces['inferred_panel_upgrade'] = False
+    dac_ecdf = ECDF(dac_permit_age)
+    non_dac_ecdf = ECDF(non_dac_permit_age)
 
-    for ind, row in dac_x.iterrows():
+    probabilities = np.where(dac, dac_ecdf(ages), non_dac_ecdf(ages))
 
-        as_built = buildings_ces.loc[ind,'panel_size_as_built']
-        existing = as_built
+    stepped = np.full(as_built.shape[0], np.nan)
+    valid = ~np.isnan(as_built)
+    stepped[valid] = NextUpgradeTier(as_built[valid], upgrade_scale)
 
-        if (row['previous_upgrade'] == True) & (buildings_ces.loc[ind, 'permitted_panel_upgrade'] == False):
-            level = upgrade_scale.index(as_built)
-            existing = upgrade_scale[level + 1]
-            buildings_ces.loc[ind,'inferred_panel_upgrade'] = True
+    ensemble_state['probabilities'] = probabilities
+    ensemble_state['as_built'] = as_built
+    ensemble_state['stepped'] = stepped
+    ensemble_state['tracts'] = tracts
+    ensemble_state['n_tracts'] = n_tracts
 
-        buildings_ces.loc[ind,'panel_size_existing'] = existing
+    return
 
-    # Non-DAC Loop
-    for ind, row in non_dac_x.iterrows():
+def EnsembleRealization(seed_sequence):
+    '''Function to draw a single realization of inferred upgrades for the
+    inference cohort and reduce it to tract level upgrade counts and
+    existing panel size sums'''
 
-        as_built = buildings_ces.loc[ind,'panel_size_as_built']
-        existing = as_built
+    rng = np.random.default_rng(seed_sequence)
 
-        if (row['previous_upgrade'] == True) & (buildings_ces.loc[ind, 'permitted_panel_upgrade'] == False):
-            level = upgrade_scale.index(as_built)
-            existing = upgrade_scale[level + 1]
-            buildings_ces.loc[ind,'inferred_panel_upgrade'] = True
+    upgrade = DrawUpgradeDecisions(ensemble_state['probabilities'], rng)
+    inferred = upgrade & ~np.isnan(ensemble_state['stepped'])
+    existing = np.where(inferred, ensemble_state['stepped'], ensemble_state['as_built'])
 
-        buildings_ces.loc[ind,'panel_size_existing'] = existing
+    tracts = ensemble_state['tracts']
+    n_tracts = ensemble_state['n_tracts']
+    valid = ~np.isnan(existing)
 
-    buildings_ces['panel_upgrade'] = buildings_ces.loc[:,['permitted_panel_upgrade','inferred_panel_upgrade']].any(axis = 1)
+    tract_upgrades = np.bincount(tracts, weights = inferred, minlength = n_tracts)
+    tract_existing = np.bincount(tracts[valid], weights = existing[valid], minlength = n_tracts)
 
-    return buildings_ces
+    return inferred, tract_upgrades, tract_existing
+
+#%% Monte Carlo Ensemble of Inferred Upgrades
+
+def InferExistingEnsemble(buildings_ces, sector, realizations = 100, seed = 12345678, processes = None, percentiles = (5, 50, 95), version = 'v1'):
+    '''Function to run an ensemble of independent realizations of the upgrade
+    inference model across a process pool. Each realization draws from its
+    own SeedSequence child and workers only receive the compact age, DAC,
+    as-built and tract arrays of the inference cohort. Realizations are
+    reduced incrementally into per-parcel upgrade probabilities and tract
+    level percentile bands of the upgrade frequency and mean existing panel
+    size. Must be run after AssignExistingFromPermit.'''
+
+    current_age, dac_cohort, non_dac_cohort, dac_permit_age, non_dac_permit_age = InferenceCohorts(buildings_ces)
+    cohort = (dac_cohort | non_dac_cohort).to_numpy()
+
+    # Encode Census Tracts as Compact Integer Codes (Missing Tracts in a Trailing Bin)
+    codes, tract_index = pd.factorize(buildings_ces['census_tract'], sort = True)
+    n_tracts = tract_index.shape[0]
+    codes[codes < 0] = n_tracts
+    codes = codes.astype(np.int32)
+
+    # Tract Level Totals Which Do Not Vary Between Realizations
+    existing = buildings_ces['panel_size_existing'].to_numpy(dtype = float)
+    as_built = buildings_ces['panel_size_as_built'].to_numpy(dtype = float)
+    permitted = (buildings_ces['permitted_panel_upgrade'] == True).to_numpy()
+    fixed_valid = ~cohort & ~np.isnan(existing)
+
+    properties_count = np.bincount(codes, weights = buildings_ces['lot_sqft'].notna().to_numpy(), minlength = n_tracts + 1)
+    fixed_upgrades = np.bincount(codes[~cohort], weights = permitted[~cohort], minlength = n_tracts + 1)
+    fixed_existing = np.bincount(codes[fixed_valid], weights = existing[fixed_valid], minlength = n_tracts + 1)
+    existing_count = np.bincount(codes[fixed_valid | (cohort & ~np.isnan(as_built))], minlength = n_tracts + 1)
+
+    # Compact Worker Inputs
+    initargs = (current_age.to_numpy(dtype = np.float32)[cohort],
+                dac_cohort.to_numpy()[cohort],
+                as_built.astype(np.float32)[cohort],
+                codes[cohort],
+                n_tracts + 1,
+                dac_permit_age.to_numpy(),
+                non_dac_permit_age.to_numpy(),
+                rules_tables.LoadRuleTable(sector, version)['inference_upgrade_scale'])
+
+    children = np.random.SeedSequence(seed).spawn(realizations)
+
+    # Incremental Reduction Buffers
+    parcel_counts = np.zeros(cohort.sum(), dtype = np.uint32)
+    upgrade_freq_pct = np.zeros((realizations, n_tracts), dtype = np.float32)
+    mean_panel_size_existing = np.zeros((realizations, n_tracts), dtype = np.float32)
+
+    def Reduce(r, result):
+        '''Accumulate a single realization into the reduction buffers'''
+
+        inferred, tract_upgrades, tract_existing = result
+        parcel_counts[:] += inferred
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            upgrade_freq_pct[r,:] = ((fixed_upgrades + tract_upgrades) / properties_count * 100.0)[:n_tracts]
+            mean_panel_size_existing[r,:] = ((fixed_existing + tract_existing) / existing_count)[:n_tracts]
+
+        return
+
+    if processes == 1:
+
+        EnsembleWorkerInit(*initargs)
+
+        for r, child in enumerate(children):
+            Reduce(r, EnsembleRealization(child))
+
+    else:
+
+        with ProcessPoolExecutor(max_workers = processes, initializer = EnsembleWorkerInit, initargs = initargs) as executor:
+
+            chunksize = max(1, realizations // (4 * (processes or os.cpu_count() or 1)))
+
+            for r, result in enumerate(executor.map(EnsembleRealization, children, chunksize = chunksize)):
+                Reduce(r, result)
+
+    # Per-Parcel Upgrade Probabilities
+    buildings_ces['inferred_upgrade_probability'] = 0.0
+    buildings_ces.loc[cohort, 'inferred_upgrade_probability'] = parcel_counts / realizations
+    buildings_ces = utils.ApplyBuildingsSchema(buildings_ces)
+
+    # Tract Level Percentile Bands
+    tract_bands = pd.DataFrame(index = pd.Index(tract_index, name = 'census_tract'))
+
+    for p in percentiles:
+        tract_bands['upgrade_freq_pct_p{}'.format(p)] = np.nanpercentile(upgrade_freq_pct, p, axis = 0)
+
+    for p in percentiles:
+        tract_bands['mean_panel_size_existing_p{}'.format(p)] = np.nanpercentile(mean_panel_size_existing, p, axis = 0)
+
+    return buildings_ces, tract_bands
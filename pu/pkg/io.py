@@ -2,148 +2,356 @@
 
 import pandas as pd
 import geopandas as gpd
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
 import sqlalchemy as sql
 import os
+import glob
+import shutil
+import hashlib
+import threading
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
 
-#%% Building Permit Data Import Function
+#%% Incremental Refresh SQL
 
-def ImportBuildingPermitData(sector):
-    '''Function to import pre-processed single family building
-    permit data from local postgres database'''
-
-    # Extract Database Connection Parameters from Environment
-    host = os.getenv('PGHOST')
-    user = os.getenv('PGUSER')
-    password = os.getenv('PGPASS')
-    port = os.getenv('PGPORT')
-    db = os.getenv('PGDATABASE')
-
-    # Establish DB Connection
-    db_con_string = 'postgresql://' + user + '@' + host + ':' + port + '/' + db
-    db_con = sql.create_engine(db_con_string)
-
-    if sector == 'single_family':
-
-        # Read Input Table from DB
-        buildings_sql = '''SELECT    "ztrax_rowid",
-                                    "apn",
-                                    "buildings",
-                                    "lot_sqft",
-                                    "county_landuse_description",
-                                    "occupancy_status_stnd_code",
-                                    "year_built"::text,
-                                    "units",
-                                    "bedrooms",
-                                    "bathrooms",
-                                    "heating_system_stnd_code",
-                                    "ac_system_stnd_code",
-                                    "building_sqft",
-                                    "centroid",
-                                    "census_tract",
-                                    "ain",
-                                    "usetype",
-                                    "usedescription",
-                                    "roll_year"::text,
-                                    "roll_landvalue",
-                                    "roll_landbaseyear"::text,
-                                    "roll_impvalue",
-                                    "roll_impbaseyear"::text,
-                                    "city",
-                                    "permit_type",
-                                    "permit_sub_type",
-                                    "permit_description",
-                                    "permit_issue_date"::text,
-                                    "panel_related_permit"
-                        FROM        la100es.panel_data_permits
-                        WHERE       "usetype" = 'Residential' AND
-                                    "usedescription" = 'Single' AND
-                                    "county_landuse_description" NOT IN ('SINGLE RESIDENTIAL - CONDOMINIUM', 'SINGLE FAMILY RESIDENTIAL - VACANT');'''
-
-    elif sector == 'multi_family':
-
-        # Read Input Table from DB
-        buildings_sql = '''SELECT    "ztrax_rowid",
-                                    "apn",
-                                    "buildings",
-                                    "lot_sqft",
-                                    "county_landuse_description",
-                                    "occupancy_status_stnd_code",
-                                    "year_built"::text,
-                                    "units",
-                                    "bedrooms",
-                                    "bathrooms",
-                                    "heating_system_stnd_code",
-                                    "ac_system_stnd_code",
-                                    "building_sqft",
-                                    "centroid",
-                                    "census_tract",
-                                    "ain",
-                                    "usetype",
-                                    "usedescription",
-                                    "roll_year"::text,
-                                    "roll_landvalue",
-                                    "roll_landbaseyear"::text,
-                                    "roll_impvalue",
-                                    "roll_impbaseyear"::text,
-                                    "city",
-                                    "permit_type",
-                                    "permit_sub_type",
-                                    "permit_description",
-                                    "permit_issue_date"::text,
-                                    "panel_related_permit"
-                        FROM        la100es.panel_data_permits
-                        WHERE       "usetype" = 'Residential' AND
-                                    "usedescription" IN ('Five or more apartments',
-                                                        'Four Units (Any Combination)',
-                                                        'Three Units (Any Combination)',
-                                                        'Two Units)') AND
-                                    "county_landuse_description" NOT IN ('APARTMENT 5+ UNITS VACANT',
-                                                                        'RESIDENTIAL - FOURPLEX VACANT',
-                                                                        'RESIDENTIAL - TRIPLEX VACANT');'''
+refresh_sql_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'sql', 'service_panel_data_refresh.sql')
+
+#%% Database Engine
+
+# Lazily created engine shared by all of the importers
+engine_state = {'engine': None,
+                'pool_size': 5,
+                'max_overflow': 5}
+engine_lock = threading.Lock()
+
+def ConfigureEngine(pool_size = 5, max_overflow = 5):
+    '''Function to set the connection pool size of the shared
+    database engine. Any existing engine is disposed so that the
+    next import creates a new one with the requested pool.'''
+
+    with engine_lock:
+        if engine_state['engine'] is not None:
+            engine_state['engine'].dispose()
+            engine_state['engine'] = None
+        engine_state['pool_size'] = pool_size
+        engine_state['max_overflow'] = max_overflow
+
+    return
+
+def GetEngine():
+    '''Function to return the shared pooled database engine, creating
+    it from the PG* environment variables on first use. The engine is
+    thread safe and can be used by concurrent importers.'''
+
+    with engine_lock:
+
+        if engine_state['engine'] is None:
+
+            # Extract Database Connection Parameters from Environment
+            host = os.getenv('PGHOST')
+            user = os.getenv('PGUSER')
+            port = os.getenv('PGPORT')
+            db = os.getenv('PGDATABASE')
+
+            # Establish DB Connection
+            db_con_string = 'postgresql://' + user + '@' + host + ':' + port + '/' + db
+            engine_state['engine'] = sql.create_engine(db_con_string,
+                                                       pool_size = engine_state['pool_size'],
+                                                       max_overflow = engine_state['max_overflow'],
+                                                       pool_pre_ping = True)
+
+        return engine_state['engine']
+
+def DisposeEngine():
+    '''Function to close all pooled connections of the shared
+    database engine.'''
+
+    with engine_lock:
+        if engine_state['engine'] is not None:
+            engine_state['engine'].dispose()
+            engine_state['engine'] = None
+
+    return
+
+#%% Snapshot Cache
+
+# Local parquet snapshot cache for imported frames, disabled when
+# cache_dir is None. In offline mode the database is never contacted
+# and the most recent snapshot for a query is served.
+cache_state = {'cache_dir': None,
+               'offline': False}
+
+def ConfigureCache(cache_dir = None, offline = False):
+    '''Function to enable the local snapshot cache in cache_dir and
+    optionally switch the importers to offline mode.'''
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+    elif offline == True:
+        raise Exception('Offline mode requires a cache directory')
+
+    cache_state['cache_dir'] = cache_dir
+    cache_state['offline'] = offline
+
+    return
+
+# Bump to invalidate all snapshots when the reader formatting changes
+# in a way that is not captured by the reader code or buildings schema
+cache_version = 1
+
+def TableFingerprint(table):
+    '''Function to fingerprint the current committed contents of a
+    database table from its row count and the largest transaction id
+    that wrote one of its rows. Unlike the cumulative statistics in
+    pg_stat_user_tables, both change as soon as a write commits.'''
+
+    fingerprint_sql = sql.text('''SELECT count(*), max("xmin"::text::bigint) FROM {}'''.format(table))
+
+    with GetEngine().connect() as con:
+        count, xmin = con.execute(fingerprint_sql).one()
+
+    return '{}:{}:{}'.format(table, count, xmin)
+
+def CodeFingerprint(reader):
+    '''Function to fingerprint the code that produces a cached frame,
+    from the cache version, the buildings schema and the bytecode of
+    the reader and of FormatBuildingPermitData.'''
+
+    parts = [str(cache_version),
+             repr(sorted((k, str(v)) for k, v in utils.buildings_schema.items())),
+             reader.__code__.co_code.hex(),
+             repr([c for c in reader.__code__.co_consts if not hasattr(c, 'co_code')]),
+             FormatBuildingPermitData.__code__.co_code.hex()]
+
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+def CachedRead(query, table, reader, columns = None):
+    '''Function to serve the frame produced by reader() from the local
+    snapshot cache. Snapshots are keyed by the query text and the
+    fingerprint of the source table so that any upstream change
+    triggers a fresh database read. Frames with a geometry column are
+    stored as GeoParquet. Snapshots written by a different version of
+    the reader code or buildings schema are never served. Only columns
+    are read from disk if given.'''
+
+    cache_dir = cache_state['cache_dir']
+
+    if cache_dir is None:
+        frame = reader()
+        return frame if columns is None else frame[columns]
+
+    query_key = hashlib.sha256((query + CodeFingerprint(reader)).encode('utf-8')).hexdigest()[:16]
+
+    if cache_state['offline'] == True:
+        snapshots = glob.glob(os.path.join(cache_dir, query_key + '_*.parquet'))
+        if len(snapshots) == 0:
+            raise Exception('No cached snapshot of {} available offline'.format(table))
+        path = max(snapshots, key = os.path.getmtime)
     else:
+        fingerprint = TableFingerprint(table)
+        fingerprint_key = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(cache_dir, query_key + '_' + fingerprint_key + '.parquet')
+
+    if not os.path.exists(path):
+        frame = reader()
+        temp_path = path + '.tmp'
+        frame.to_parquet(temp_path)
+        os.replace(temp_path, path)
+        return frame if columns is None else frame[columns]
+
+    return utils.ReadParquet(path, columns)
+
+#%% Building Permit Query Components
+
+# Columns read from la100es.panel_data_permits for both sectors
+buildings_columns = ['ztrax_rowid',
+                     'apn',
+                     'buildings',
+                     'lot_sqft',
+                     'county_landuse_description',
+                     'occupancy_status_stnd_code',
+                     'year_built',
+                     'units',
+                     'bedrooms',
+                     'bathrooms',
+                     'heating_system_stnd_code',
+                     'ac_system_stnd_code',
+                     'building_sqft',
+                     'centroid',
+                     'census_tract',
+                     'ain',
+                     'usetype',
+                     'usedescription',
+                     'roll_year',
+                     'roll_landvalue',
+                     'roll_landbaseyear',
+                     'roll_impvalue',
+                     'roll_impbaseyear',
+                     'city',
+                     'permit_type',
+                     'permit_sub_type',
+                     'permit_description',
+                     'permit_issue_date',
+                     'panel_related_permit']
+
+# Date columns transferred as native timestamps
+buildings_date_columns = ['year_built',
+                          'permit_issue_date']
+
+# Date columns of which only the year is used, transferred as integers
+buildings_year_columns = ['roll_year',
+                          'roll_landbaseyear',
+                          'roll_impbaseyear']
+
+# Sector specific record filters
+buildings_sector_filters = {
+    'single_family': '''"usetype" = 'Residential' AND
+                        "usedescription" = 'Single' AND
+                        "county_landuse_description" NOT IN ('SINGLE RESIDENTIAL - CONDOMINIUM', 'SINGLE FAMILY RESIDENTIAL - VACANT')''',
+    'multi_family': '''"usetype" = 'Residential' AND
+                       "usedescription" IN ('Five or more apartments',
+                                           'Four Units (Any Combination)',
+                                           'Three Units (Any Combination)',
+                                           'Two Units)') AND
+                       "county_landuse_description" NOT IN ('APARTMENT 5+ UNITS VACANT',
+                                                           'RESIDENTIAL - FOURPLEX VACANT',
+                                                           'RESIDENTIAL - TRIPLEX VACANT')'''}
+
+#%% Building Permit Column Expressions
+
+def BuildingPermitColumn(column, prefix = ''):
+    '''Function to return the select expression for a building permit
+    column. Date columns are read as native timestamps, or as integer
+    years where only the year is used, with the '0001-01-01 BC'
+    missing value sentinels nulled in the database.'''
+
+    name = prefix + '"{}"'.format(column)
+
+    if column in buildings_date_columns:
+        return '''CASE WHEN {0} < DATE '0001-01-01' THEN NULL ELSE {0}::timestamp END AS "{1}"'''.format(name, column)
+    elif column in buildings_year_columns:
+        return '''CASE WHEN {0} < DATE '0001-01-01' THEN NULL ELSE EXTRACT(YEAR FROM {0})::int2 END AS "{1}"'''.format(name, column)
+    else:
+        return name
+
+#%% Building Permit Query Constructor
+
+def BuildingPermitQuery(sector, coalesce = False):
+    '''Function to construct the building permit import query for a
+    sector. If coalesce is True the parcel x permit rows are collapsed
+    server side to one record per apn, keeping the earliest permit
+    record and joining all of the parcel's permit descriptions with
+    '; ', in the same manner as utils.CoalesceRecords.'''
 
+    if sector not in buildings_sector_filters:
         raise Exception("Sector must be either 'single-family' or multi_family'")
 
-    buildings = pd.read_sql(buildings_sql, db_con)
+    where = buildings_sector_filters[sector]
+
+    if coalesce == False:
+
+        select = ',\n                                    '.join(BuildingPermitColumn(c) for c in buildings_columns)
+
+        buildings_sql = '''SELECT {}
+                        FROM        la100es.panel_data_permits
+                        WHERE       {};'''.format(select, where)
+
+    else:
+
+        select = ',\n                                    '.join('B."permit_description"' if c == 'permit_description' else
+                            BuildingPermitColumn(c, 'A.') for c in buildings_columns)
+
+        buildings_sql = '''WITH sector AS (
+                            SELECT      *
+                            FROM        la100es.panel_data_permits
+                            WHERE       {1}),
+                        descriptions AS (
+                            SELECT      "apn",
+                                        string_agg("permit_description", '; ' ORDER BY "permit_issue_date", "ztrax_rowid") AS "permit_description"
+                            FROM        sector
+                            GROUP BY    "apn")
+                        SELECT DISTINCT ON (A."apn") {0}
+                        FROM        sector AS A
+                        JOIN        descriptions AS B
+                        ON          A."apn" = B."apn"
+                        ORDER BY    A."apn", A."permit_issue_date", A."ztrax_rowid";'''.format(select, where)
+
+    return buildings_sql
+
+#%% Building Permit Data Formatting
+
+def FormatBuildingPermitData(buildings):
+    '''Function to convert the columns of building permit records read
+    from the database to their analysis dtypes.'''
 
     buildings['census_tract'] = pd.to_numeric(buildings['census_tract'], errors = 'coerce')
 
-    buildings.loc[buildings['year_built'] == '0001-01-01 BC', 'year_built'] = ''
-    buildings.loc[buildings['roll_year'] == '0001-01-01 BC', 'roll_year'] = ''
-    buildings.loc[buildings['roll_landbaseyear'] == '0001-01-01 BC', 'roll_landbaseyear'] = ''
-    buildings.loc[buildings['roll_impbaseyear'] == '0001-01-01 BC', 'roll_impbaseyear'] = ''
-    buildings.loc[buildings['permit_issue_date'] == '0001-01-01 BC', 'permit_issue_date'] = ''
+    for c in buildings_date_columns:
+        buildings[c] = buildings[c].astype('datetime64[ns]')
+
+    buildings = utils.ApplyBuildingsSchema(buildings)
+
+    return buildings
+
+#%% Building Permit Data Import Function
+
+def ImportBuildingPermitData(sector, coalesce = False, columns = None):
+    '''Function to import pre-processed single family building
+    permit data from local postgres database. If coalesce is True
+    duplicate parcel records are collapsed in the database rather
+    than with utils.CoalesceRecords after import. Reads are served
+    from the snapshot cache when it is configured.'''
+
+    # Read Input Table from DB
+    buildings_sql = BuildingPermitQuery(sector, coalesce)
+
+    def Reader():
+
+        # Shared DB Connection
+        db_con = GetEngine()
+
+        buildings = gpd.read_postgis(buildings_sql, db_con, geom_col = 'centroid')
+
+        return FormatBuildingPermitData(buildings)
 
-    buildings['year_built'] = pd.to_datetime(buildings['year_built'], format = '%Y-%m-%d')
-    buildings['roll_year'] = pd.to_datetime(buildings['roll_year'], format = '%Y-%m-%d')
-    buildings['roll_landbaseyear'] = pd.to_datetime(buildings['roll_landbaseyear'], format = '%Y-%m-%d')
-    buildings['roll_impbaseyear'] = pd.to_datetime(buildings['roll_impbaseyear'], format = '%Y-%m-%d')
-    buildings['permit_issue_date'] = pd.to_datetime(buildings['permit_issue_date'], format = 'mixed')
+    buildings = CachedRead(buildings_sql, 'la100es.panel_data_permits', Reader, columns)
 
     return buildings
 
+#%% Streaming Building Permit Data Import Function
+
+def ImportBuildingPermitChunks(sector, chunksize = 100000):
+    '''Generator to stream the building permit data for a sector from
+    the database in formatted chunks of at most chunksize records,
+    using a server side cursor so that the full result is never held
+    in memory. Records are coalesced in the database and ordered by
+    apn, so that each parcel appears in exactly one chunk.'''
+
+    buildings_sql = BuildingPermitQuery(sector, coalesce = True)
+
+    with GetEngine().connect().execution_options(stream_results = True) as con:
+        for chunk in gpd.read_postgis(buildings_sql, con, geom_col = 'centroid', chunksize = chunksize):
+            yield FormatBuildingPermitData(chunk)
+
 #%% Read Census Tract Level DAC Data
 
 def ImportCalEnviroScreenData():
     '''Function to import cal-enviro-screen census tract level
     geospatial data from local postgres database'''
 
-    # Extract Database Connection Parameters from Environment
-    host = os.getenv('PGHOST')
-    user = os.getenv('PGUSER')
-    password = os.getenv('PGPASS')
-    port = os.getenv('PGPORT')
-    db = os.getenv('PGDATABASE')
-
-    # Establish DB Connection
-    db_con_string = 'postgresql://' + user + '@' + host + ':' + port + '/' + db
-    db_con = sql.create_engine(db_con_string)
-
     # Read table from database and format columns
     ces4_sql = '''SELECT * FROM ladwp.ces4'''
-    ces4 = gpd.read_postgis(ces4_sql, db_con, geom_col = 'geom')
-    cols = [x.lower() for x in ces4.columns]
-    ces4.columns = cols
+
+    def Reader():
+        ces4 = gpd.read_postgis(ces4_sql, GetEngine(), geom_col = 'geom')
+        cols = [x.lower() for x in ces4.columns]
+        ces4.columns = cols
+        return ces4
+
+    ces4 = CachedRead(ces4_sql, 'ladwp.ces4', Reader)
 
     return ces4
 
@@ -153,22 +361,16 @@ def ImportSB535Data():
     '''Function to import SB-535 census tract level geospatial
     data from local postgres database'''
 
-    # Extract Database Connection Parameters from Environment
-    host = os.getenv('PGHOST')
-    user = os.getenv('PGUSER')
-    password = os.getenv('PGPASS')
-    port = os.getenv('PGPORT')
-    db = os.getenv('PGDATABASE')
-
-    # Establish DB Connection
-    db_con_string = 'postgresql://' + user + '@' + host + ':' + port + '/' + db
-    db_con = sql.create_engine(db_con_string)
-
     # Read table from database and format columns
     sb535_sql = '''SELECT * FROM ladwp.sb535_dacs'''
-    sb535 = gpd.read_postgis(sb535_sql, db_con, geom_col = 'geom')
-    cols = [x.lower() for x in sb535.columns]
-    sb535.columns = cols
+
+    def Reader():
+        sb535 = gpd.read_postgis(sb535_sql, GetEngine(), geom_col = 'geom')
+        cols = [x.lower() for x in sb535.columns]
+        sb535.columns = cols
+        return sb535
+
+    sb535 = CachedRead(sb535_sql, 'ladwp.sb535_dacs', Reader)
 
     return sb535
 
@@ -178,19 +380,340 @@ def ImportLadwpServiceTerritoryData():
     '''Function to import ladwp utility service territory
     geospatial data from local postgres database'''
 
-    # Extract Database Connection Parameters from Environment
-    host = os.getenv('PGHOST')
-    user = os.getenv('PGUSER')
-    password = os.getenv('PGPASS')
-    port = os.getenv('PGPORT')
-    db = os.getenv('PGDATABASE')
-
-    # Establish DB Connection
-    db_con_string = 'postgresql://' + user + '@' + host + ':' + port + '/' + db
-    db_con = sql.create_engine(db_con_string)
-
     # Read table from database and format columns
     ladwp_sql = '''SELECT * FROM ladwp.service_territory'''
-    ladwp = gpd.read_postgis(ladwp_sql, con = db_con, geom_col = 'geom')
+
+    def Reader():
+        return gpd.read_postgis(ladwp_sql, con = GetEngine(), geom_col = 'geom')
+
+    ladwp = CachedRead(ladwp_sql, 'ladwp.service_territory', Reader)
 
     return ladwp
+
+#%% Concurrent Sector Data Import
+
+def ImportSectorData(sector, coalesce = True):
+    '''Function to import the building permit data for a sector
+    together with the cal-enviro-screen and ladwp service territory
+    context layers. The three reads are independent and run
+    concurrently on the shared engine, so the import time is bounded
+    by the slowest table. Returns a (buildings, ces4, ladwp) tuple.'''
+
+    with ThreadPoolExecutor(max_workers = 3) as executor:
+        buildings = executor.submit(ImportBuildingPermitData, sector, coalesce)
+        ces4 = executor.submit(ImportCalEnviroScreenData)
+        ladwp = executor.submit(ImportLadwpServiceTerritoryData)
+
+        return buildings.result(), ces4.result(), ladwp.result()
+
+#%% Postgres Column Types for Export
+
+def PostgresColumnType(series):
+    '''Function to return the postgres column type used to store a
+    buildings frame column when exporting to the database. Unsigned
+    integers are stored in the next wider signed type so that their
+    full range fits.'''
+
+    dtype = series.dtype
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOL'
+    elif pd.api.types.is_unsigned_integer_dtype(dtype):
+        return {1: 'INT2', 2: 'INT4', 4: 'INT8'}.get(dtype.itemsize, 'NUMERIC')
+    elif pd.api.types.is_integer_dtype(dtype):
+        return {1: 'INT2', 2: 'INT2', 4: 'INT4'}.get(dtype.itemsize, 'INT8')
+    elif pd.api.types.is_float_dtype(dtype):
+        return 'REAL' if dtype.itemsize == 4 else 'FLOAT8'
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    else:
+        return 'TEXT'
+
+#%% Postgres Geometry Column Type for Export
+
+def FrameSRID(frame, geom_col = 'centroid'):
+    '''Function to return the EPSG code of the coordinate reference
+    system of the geometry column of a frame.'''
+
+    crs = gpd.GeoSeries(frame[geom_col]).crs
+
+    if crs is None or crs.to_epsg() is None:
+        raise Exception('Geometry column {} must have a CRS with an EPSG code to export'.format(geom_col))
+
+    return crs.to_epsg()
+
+def PostgresGeometryType(frame, geom_col = 'centroid'):
+    '''Function to return the typed postgis column type used to store
+    the geometry column of a frame, e.g. GEOMETRY(Point, 3310).'''
+
+    geom_types = gpd.GeoSeries(frame[geom_col]).geom_type.dropna().unique()
+    geom_type = geom_types[0] if len(geom_types) == 1 else 'Geometry'
+
+    return 'GEOMETRY({}, {})'.format(geom_type, FrameSRID(frame, geom_col))
+
+#%% Stream a Frame Into a Table With COPY
+
+def CopyFrame(cur, frame, schema, table, geom_col = 'centroid', chunksize = 100000):
+    '''Function to stream the rows of a frame into an existing postgres
+    table with COPY FROM STDIN in csv form, in chunks of chunksize
+    records. The geometry column is sent as hex EWKB carrying the SRID
+    of the frame's CRS, so it loads directly into typed geometry
+    columns.'''
+
+    cols = list(frame.columns)
+    copy_sql = '''COPY {}.{} ({}) FROM STDIN WITH (FORMAT csv)'''.format(schema, table, ', '.join('"{}"'.format(c) for c in cols))
+
+    if geom_col in cols:
+        srid = FrameSRID(frame, geom_col)
+
+    for start in range(0, frame.shape[0], chunksize):
+
+        chunk = frame.iloc[start:start + chunksize]
+
+        if geom_col in cols:
+            geoms = shapely.set_srid(np.asarray(gpd.GeoSeries(chunk[geom_col]).values), srid)
+            chunk = pd.DataFrame(chunk)
+            chunk[geom_col] = shapely.to_wkb(geoms, hex = True, include_srid = True)
+
+        buffer = StringIO()
+        chunk.to_csv(buffer, header = False, index = False)
+        buffer.seek(0)
+        cur.copy_expert(copy_sql, buffer)
+
+    return
+
+#%% Bulk Export of Frames to Database
+
+def ExportFrame(frame, table, schema = 'la100es', geom_col = 'centroid', chunksize = 100000, indexes = None):
+    '''Function to bulk export a frame, such as the final buildings
+    frame or the building permits, to a postgres table using COPY FROM
+    STDIN in csv form. Rows are streamed to a staging table in chunks
+    of chunksize records, with the geometry column as hex EWKB in the
+    SRID of the frame's CRS. The staging table then replaces the target
+    table within the same transaction, so readers never see a partially
+    written table, and the spatial index and b-tree indexes on any
+    columns listed in indexes are rebuilt. If views depend on the
+    target table it is truncated and refilled from the staging table
+    instead, keeping the views and the existing indexes.'''
+
+    staging = table + '_staging'
+    cols = list(frame.columns)
+
+    # Column Definitions
+    definitions = []
+    for c in cols:
+        if c == geom_col:
+            definitions.append('"{}" {}'.format(c, PostgresGeometryType(frame, geom_col)))
+        else:
+            definitions.append('"{}" {}'.format(c, PostgresColumnType(frame[c])))
+
+    # Views Depending on the Target Table
+    views_sql = '''SELECT count(DISTINCT R."ev_class")
+                   FROM pg_depend AS D
+                   JOIN pg_rewrite AS R ON R."oid" = D."objid"
+                   WHERE D."refobjid" = to_regclass(%s) AND R."ev_class" <> D."refobjid"'''
+
+    con = GetEngine().raw_connection()
+
+    try:
+
+        cur = con.cursor()
+
+        cur.execute('''DROP TABLE IF EXISTS {}.{}'''.format(schema, staging))
+        cur.execute('''CREATE UNLOGGED TABLE {}.{} ({})'''.format(schema, staging, ', '.join(definitions)))
+
+        CopyFrame(cur, frame, schema, staging, geom_col, chunksize)
+
+        cur.execute(views_sql, ('{}.{}'.format(schema, table),))
+
+        if cur.fetchone()[0] > 0:
+
+            # Refill Target Table in Place
+            names = ', '.join('"{}"'.format(c) for c in cols)
+            cur.execute('''TRUNCATE {}.{}'''.format(schema, table))
+            cur.execute('''INSERT INTO {0}.{2} ({3}) SELECT {3} FROM {0}.{1}'''.format(schema, staging, table, names))
+            cur.execute('''DROP TABLE {}.{}'''.format(schema, staging))
+
+        else:
+
+            # Swap Staging Table Into Place
+            cur.execute('''ALTER TABLE {}.{} SET LOGGED'''.format(schema, staging))
+            cur.execute('''DROP TABLE IF EXISTS {}.{}'''.format(schema, table))
+            cur.execute('''ALTER TABLE {}.{} RENAME TO {}'''.format(schema, staging, table))
+
+            if geom_col in cols:
+                cur.execute('''CREATE INDEX ON {}.{} USING GIST ("{}")'''.format(schema, table, geom_col))
+
+            for c in (indexes or []):
+                cur.execute('''CREATE INDEX ON {}.{} ("{}")'''.format(schema, table, c))
+
+        con.commit()
+
+    except Exception:
+
+        con.rollback()
+        raise
+
+    finally:
+
+        con.close()
+
+    return
+
+#%% Permit Data Watermark
+
+def PermitWatermark(schema = 'la100es', table = 'la_city_building_permits'):
+    '''Function to return the latest issue and submitted dates of the
+    building permits already loaded in the database, used as the
+    watermark for incremental permit ingestion. Both dates are None if
+    the table does not exist or is empty.'''
+
+    exists_sql = sql.text('''SELECT to_regclass(:table) IS NOT NULL''')
+    watermark_sql = sql.text('''SELECT max("ISSUE_DATE"), max("SUBMITTED_DATE") FROM {}.{}'''.format(schema, table))
+
+    with GetEngine().connect() as con:
+        if con.execute(exists_sql, {'table': '{}.{}'.format(schema, table)}).scalar() == False:
+            return None, None
+        issue_date, submitted_date = con.execute(watermark_sql).one()
+
+    return issue_date, submitted_date
+
+#%% Incremental Permit Data Upsert
+
+def UpsertPermitData(permits, key_col, schema = 'la100es', table = 'la_city_building_permits', geom_col = 'geometry', chunksize = 100000, refresh = True):
+    '''Function to upsert new or changed building permits into the
+    permit table, keyed on the permit number in key_col. The permits
+    are copied to a staging table, existing permits with the same key
+    are replaced, and, if refresh is True, the records of the affected
+    parcels in la100es.panel_data_permits are rebuilt with
+    sql/service_panel_data_refresh.sql, all in a single transaction.
+    The panel assignments derived from those records are not updated
+    here and require a full run of the sector scripts.'''
+
+    staging = table + '_staging'
+
+    con = GetEngine().raw_connection()
+
+    try:
+
+        cur = con.cursor()
+
+        cur.execute('''DROP TABLE IF EXISTS {}.{}'''.format(schema, staging))
+        cur.execute('''CREATE UNLOGGED TABLE {0}.{1} (LIKE {0}.{2} INCLUDING DEFAULTS)'''.format(schema, staging, table))
+
+        CopyFrame(cur, permits, schema, staging, geom_col, chunksize)
+
+        # Parcels Affected by New or Changed Permits
+        cur.execute('''CREATE TEMP TABLE permit_refresh_apns ON COMMIT DROP AS
+                       SELECT "APN" FROM {0}.{1}
+                       UNION
+                       SELECT A."APN" FROM {0}.{2} AS A
+                       JOIN {0}.{1} AS B ON A."{3}" = B."{3}"'''.format(schema, staging, table, key_col))
+
+        # Replace Existing Permits
+        cols = ', '.join('"{}"'.format(c) for c in permits.columns)
+        cur.execute('''DELETE FROM {0}.{2} AS A USING {0}.{1} AS B WHERE A."{3}" = B."{3}"'''.format(schema, staging, table, key_col))
+        cur.execute('''INSERT INTO {0}.{2} ({3}) SELECT {3} FROM {0}.{1}'''.format(schema, staging, table, cols))
+        cur.execute('''DROP TABLE {}.{}'''.format(schema, staging))
+
+        # Rebuild Affected Parcel Records
+        if refresh == True:
+            with open(refresh_sql_path) as f:
+                cur.execute(f.read())
+
+        con.commit()
+
+    except Exception:
+
+        con.rollback()
+        raise
+
+    finally:
+
+        con.close()
+
+    return
+
+#%% Partitioned GeoParquet Output
+
+def PartitionDirectory(col, value):
+    '''Function to return the hive partition directory name for a
+    partition column value. Missing values use the hive default
+    partition name and integral floats are written without a decimal.'''
+
+    if pd.isna(value):
+        value = '__HIVE_DEFAULT_PARTITION__'
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return '{}={}'.format(col, value)
+
+def WriteBuildingsGeoParquet(buildings, path, partition_cols = ['dac_status'], geom_col = 'centroid', crs = 'EPSG:3310', row_group_size = 50000):
+    '''Function to write a final buildings frame as a hive partitioned
+    GeoParquet dataset under path, with one directory per combination
+    of the partition column values. Records are sorted by census tract
+    within each partition and written with row group statistics, so
+    readers can load only the columns, partitions and row groups they
+    need, e.g. pd.read_parquet(path, columns = [...], filters = [...]).
+    The written dataset is checked against the frame with
+    VerifyBuildingsGeoParquet.'''
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    buildings_gdf = gpd.GeoDataFrame(buildings, geometry = geom_col)
+
+    if buildings_gdf.crs is None:
+        buildings_gdf = buildings_gdf.set_crs(crs)
+
+    for key, partition in buildings_gdf.groupby(partition_cols, observed = True, sort = True, dropna = False):
+
+        key = key if isinstance(key, tuple) else (key,)
+        part_dir = os.path.join(path, *[PartitionDirectory(c, v) for c, v in zip(partition_cols, key)])
+        os.makedirs(part_dir, exist_ok = True)
+
+        # Census Tract is Constant Within Tract Partitions
+        if 'census_tract' not in partition_cols:
+            partition = partition.sort_values('census_tract')
+
+        partition = partition.drop(columns = partition_cols)
+        partition.to_parquet(os.path.join(part_dir, 'part-0.parquet'),
+                             index = False,
+                             row_group_size = row_group_size,
+                             write_statistics = True)
+
+    VerifyBuildingsGeoParquet(buildings_gdf, path, partition_cols)
+
+    return path
+
+def VerifyBuildingsGeoParquet(buildings, path, partition_cols = ['dac_status']):
+    '''Function to check a GeoParquet dataset written by
+    WriteBuildingsGeoParquet against its source frame from the file
+    footers alone: every partition of the frame has a file, the files
+    hold all of the non-partition columns and the row counts match.'''
+
+    expected = buildings.groupby(partition_cols, observed = True, dropna = False).size()
+    data_cols = [c for c in buildings.columns if c not in partition_cols]
+
+    for key, count in expected.items():
+
+        key = key if isinstance(key, tuple) else (key,)
+        part_path = os.path.join(path, *[PartitionDirectory(c, v) for c, v in zip(partition_cols, key)], 'part-0.parquet')
+
+        if not os.path.exists(part_path):
+            raise Exception('Missing GeoParquet partition {}'.format(part_path))
+
+        metadata = pq.read_metadata(part_path)
+        missing = set(data_cols) - set(metadata.schema.names)
+
+        if metadata.num_rows != count:
+            raise Exception('GeoParquet partition {} has {} rows, expected {}'.format(part_path, metadata.num_rows, count))
+        elif len(missing) > 0:
+            raise Exception('GeoParquet partition {} is missing columns {}'.format(part_path, sorted(missing)))
+
+    written = glob.glob(os.path.join(path, *['*'] * len(partition_cols), 'part-0.parquet'))
+
+    if len(written) != expected.shape[0]:
+        raise Exception('GeoParquet dataset {} has {} partitions, expected {}'.format(path, len(written), expected.shape[0]))
+
+    return
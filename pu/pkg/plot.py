@@ -8,19 +8,71 @@ import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FormatStrFormatter, StrMethodFormatter
 import seaborn as sns
+import shapely
+from scipy.stats import gaussian_kde
+from scipy.signal import fftconvolve
+from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+#%% Base Map Layers
+
+# Fixed map extent of the LADWP service territory (xmin, ymin, xmax, ymax)
+map_extent = (120000, -480000, 170000, -405000)
+
+# Base map layers cached for the most recently used ces4 / ladwp frames
+basemap_cache = {}
+
+def BaseMapLayers(ces4, ladwp, tolerance = 25.0):
+    '''Function to compute the tract boundary and service territory
+    overlay line segments once, clipped to the fixed map extent and
+    simplified to the render resolution (about 25 m per pixel at 300
+    dpi), and cache them for reuse by every map. Returns a list of
+    (segments, line style) layers in drawing order.'''
+
+    if basemap_cache.get('ces4') is ces4 and basemap_cache.get('ladwp') is ladwp:
+        return basemap_cache['layers']
+
+    extent = shapely.geometry.box(*map_extent)
+
+    def Segments(geoms):
+        lines = geoms.boundary.clip(extent).simplify(tolerance).explode(index_parts = False)
+        lines = lines[lines.geom_type == 'LineString']
+        return [np.asarray(line.coords)[:,:2] for line in lines]
+
+    dac_ind = ces4['ciscorep'] >= 75.0
+    non_dac_ind = ces4['ciscorep'] < 75.0
+
+    layers = [(Segments(ces4.loc[~(dac_ind | non_dac_ind)].geometry), {'colors': 'k', 'linewidths': 0.5}),
+              (Segments(ces4.loc[dac_ind].geometry), {'colors': 'tab:orange', 'linewidths': 0.5}),
+              (Segments(ces4.loc[non_dac_ind].geometry), {'colors': 'tab:blue', 'linewidths': 0.5}),
+              (Segments(ladwp.geometry), {'colors': 'black', 'linewidths': 1.5})]
+
+    basemap_cache.update({'ces4': ces4, 'ladwp': ladwp, 'layers': layers})
+
+    return layers
+
+def DrawBaseMap(ax, ces4, ladwp):
+    '''Function to draw the cached tract boundary and service territory
+    overlays on a map axis.'''
+
+    for segments, style in BaseMapLayers(ces4, ladwp):
+        ax.add_collection(LineCollection(segments, **style))
+
+    ax.set_aspect('equal')
+
+    return
 
 #%% Plot the Number of SF Buildings by Tract
 
-def CountsMap(buildings, ces4, ladwp, sector, figure_dir):
+def CountsMap(panel_stats_ces_geo, ces4, ladwp, sector, figure_dir):
 
     fig, ax = plt.subplots(1, 1, figsize = (10,10))
 
-    count = buildings.groupby('census_tract')['apn'].agg('count')
-    col = 'apn'
-    count_df = pd.merge(ces4.loc[:,['geom','tract','ciscorep']], count, left_on = 'tract', right_on = 'census_tract')
-    count_df.rename(columns = {'geom':'geometry'}, inplace = True)
-    count_gdf = gpd.GeoDataFrame(count_df)
-    count_gdf.plot(column = col,
+    panel_stats_ces_geo.plot(column = 'apn_count',
         ax = ax,
         cmap = 'bone_r',
         scheme = 'fisher_jenks',
@@ -28,13 +80,7 @@ def CountsMap(buildings, ces4, ladwp, sector, figure_dir):
         legend_kwds = {'title': '{} Properties\n[Counts]\n'.format(sector.capitalize()),
                         'loc': 'lower left'})
 
-    dac_ind = ces4['ciscorep'] >= 75.0
-    non_dac_ind = ces4['ciscorep'] < 75.0
-
-    ces4.loc[~(dac_ind | non_dac_ind)].boundary.plot(ax = ax, edgecolor = 'k', linewidth = 0.5)
-    ces4.loc[dac_ind].boundary.plot(ax = ax, color = 'tab:orange', linewidth = 0.5)
-    ces4.loc[non_dac_ind].boundary.plot(ax = ax, color = 'tab:blue', linewidth = 0.5)
-    ladwp.boundary.plot(ax = ax, edgecolor = 'black', linewidth = 1.5)
+    DrawBaseMap(ax, ces4, ladwp)
 
     ax.set_ylim((-480000,-405000))
     ax.set_xlim((120000,170000))
@@ -49,22 +95,11 @@ def CountsMap(buildings, ces4, ladwp, sector, figure_dir):
 
 #%% Plot As-Built Mean Panel Size by Tract
 
-def AsBuiltPanelRatingsMap(buildings_ces, ces4, ladwp, sector, figure_dir):
-
-    as_built_avg = buildings_ces.groupby('census_tract')['panel_size_as_built'].agg('mean')
-    as_built_df = pd.merge(ces4.loc[:,['geom','tract','ciscorep']], as_built_avg, left_on = 'tract', right_on = 'census_tract')
-    as_built_df.rename(columns = {'geom':'geometry'}, inplace = True)
-    as_built = gpd.GeoDataFrame(as_built_df)
+def AsBuiltPanelRatingsMap(panel_stats_ces_geo, ces4, ladwp, sector, figure_dir):
 
     fig, ax = plt.subplots(1, 1, figsize = (10,10))
 
-    dac_ind = ces4['ciscorep'] >= 75.0
-    non_dac_ind = ces4['ciscorep'] < 75.0
-
-    ces4.loc[~(dac_ind | non_dac_ind)].boundary.plot(ax = ax, edgecolor = 'k', linewidth = 0.5)
-    ces4.loc[dac_ind].boundary.plot(ax = ax, color = 'tab:orange', linewidth = 0.5)
-    ces4.loc[non_dac_ind].boundary.plot(ax = ax, color = 'tab:blue', linewidth = 0.5)
-    ladwp.boundary.plot(ax = ax, edgecolor = 'black', linewidth = 1.5)
+    DrawBaseMap(ax, ces4, ladwp)
 
     if sector == 'single_family':
         bins = [30, 60, 100, 125, 150, 200, 300, 400]
@@ -77,8 +112,8 @@ def AsBuiltPanelRatingsMap(buildings_ces, ces4, ladwp, sector, figure_dir):
         k = len(bins)
         title = 'Mean Load Center Rating\nAs-Built [Amps]\n'
 
-    as_built.plot(ax = ax,
-        column = 'panel_size_as_built',
+    panel_stats_ces_geo.plot(ax = ax,
+        column = 'mean_panel_size_as_built',
         scheme='user_defined',
         classification_kwds = {'bins' : bins},
         k = k,
@@ -185,13 +220,13 @@ def AsBuiltPanelRatingsBar(buildings_ces, sector, figure_dir):
     # Compute counts
 
     if sector == 'single_family':
-        counts = buildings_ces.groupby(['dac_status', 'panel_size_as_built'])['apn'].agg('count')
+        counts = buildings_ces.groupby(['dac_status', 'panel_size_as_built'], observed = True)['apn'].agg('count')
         counts = counts.unstack(level= 0)
         counts.index = counts.index.astype(int)
         ylabel = 'As-Built Panel Rating \n[Amps]'
         xlabel = 'Number of Properties'
     elif sector == 'multi_family':
-        counts = buildings_ces.groupby(['dac_status', 'panel_size_as_built'])['units'].agg('sum')
+        counts = buildings_ces.groupby(['dac_status', 'panel_size_as_built'], observed = True)['units'].agg('sum')
         counts = counts.unstack(level= 0)
         counts.index = counts.index.astype(int)
         ylabel = 'Average As-Built Load Center Rating per Unit \n[Amps]'
@@ -224,7 +259,7 @@ def PermitTimeSeries(buildings_ces, sector, figure_dir):
     # Generate Time Series of Permits by DAC Status
 
     upgrade_ind = buildings_ces['panel_related_permit'] == True
-    permit_ts = buildings_ces.loc[upgrade_ind].groupby([pd.Grouper(key='permit_issue_date', axis=0, freq='1Y'), 'dac_status'])['apn'].agg('count')
+    permit_ts = buildings_ces.loc[upgrade_ind].groupby([pd.Grouper(key='permit_issue_date', axis=0, freq='1Y'), 'dac_status'], observed = True)['apn'].agg('count')
     permit_ts = permit_ts.reset_index()
     permit_ts = permit_ts.rename(columns = {'apn': 'permit_count'})
 
@@ -239,7 +274,7 @@ def PermitTimeSeries(buildings_ces, sector, figure_dir):
 
     # Generate Cumsum of Permits by DAC Status
 
-    permit_cs = buildings_ces.loc[upgrade_ind].groupby([pd.Grouper(key='permit_issue_date', axis=0, freq='1Y'), 'dac_status'])['apn'].agg('count')
+    permit_cs = buildings_ces.loc[upgrade_ind].groupby([pd.Grouper(key='permit_issue_date', axis=0, freq='1Y'), 'dac_status'], observed = True)['apn'].agg('count')
     permit_cs = permit_cs.sort_index()
     dac_vals = permit_cs.loc(axis = 0)[:,'DAC'].cumsum()
     non_dac_vals = permit_cs.loc(axis = 0)[:,'Non-DAC'].cumsum()
@@ -321,7 +356,7 @@ def PermitCountsBar(buildings_ces, sector, figure_dir):
 
     upgrade_ind = buildings_ces['panel_related_permit'] == True
     upgrade_data = buildings_ces.loc[upgrade_ind,:].copy()
-    upgrade_stats = upgrade_data.groupby('dac_status')['apn'].agg('count')
+    upgrade_stats = upgrade_data.groupby('dac_status', observed = True)['apn'].agg('count')
     upgrade_stats = pd.DataFrame(upgrade_stats).reset_index()
 
     fig, ax = plt.subplots(1, 1, figsize = (5,5), sharex = True)
@@ -350,29 +385,15 @@ def PermitCountsBar(buildings_ces, sector, figure_dir):
 
 #%% Function to Map the Cumulative Total Number of Permits by Tract
 
-def PermitCountsMap(buildings_ces, ces4, ladwp, sector, figure_dir):
+def PermitCountsMap(panel_stats_ces_geo, ces4, ladwp, sector, figure_dir):
     '''Function to map the cumulative total number of buildings with
     panel upgrade pemits by census tract and DAC status'''
 
-    # Count the Total Number of Buildings in the Permit Data Tracts
-
-    tracts = buildings_ces['census_tract'].unique()
-    ind = ces4['tract'].isin(tracts)
-
-    permits_per_tract = buildings_ces.groupby(['census_tract'])['apn'].agg('count')
-    permits_per_tract_ces = pd.merge(ces4.loc[:,['geom','tract']], permits_per_tract, left_on = 'tract', right_index = True)
-
     # Plot Census Tracts with Permit Data
 
     fig, ax = plt.subplots(1, 1, figsize = (10,10))
 
-    dac_ind = ces4['ciscorep'] >= 75.0
-    non_dac_ind = ces4['ciscorep'] < 75.0
-
-    ces4.loc[~(dac_ind | non_dac_ind)].boundary.plot(ax = ax, edgecolor = 'k', linewidth = 0.5)
-    ces4.loc[dac_ind].boundary.plot(ax = ax, color = 'tab:orange', linewidth = 0.5)
-    ces4.loc[non_dac_ind].boundary.plot(ax = ax, color = 'tab:blue', linewidth = 0.5)
-    ladwp.boundary.plot(ax = ax, edgecolor = 'black', linewidth = 1.5)
+    DrawBaseMap(ax, ces4, ladwp)
 
     if sector == 'single_family':
         title = 'Single Family Properties\nPermitted Panel Upgrades\n[Counts]\n'
@@ -383,8 +404,8 @@ def PermitCountsMap(buildings_ces, ces4, ladwp, sector, figure_dir):
         bins = [100,250,500,750,1000,1500,2000]
         labels = ["1-100", "100-250", "250-500", "500-750","750-1000", "1000-1500", "1500+"]
 
-    permits_per_tract_ces.plot(ax = ax,
-        column = 'apn',
+    panel_stats_ces_geo.plot(ax = ax,
+        column = 'apn_count',
         k = 7,
         cmap = 'bone_r',
         scheme = 'user_defined',
@@ -407,57 +428,89 @@ def PermitCountsMap(buildings_ces, ces4, ladwp, sector, figure_dir):
 
 #%% Function to Animate Permit Histogram by Vintage Year
 
-def PermitCountsHistAnimation(buildings_ces, figure_dir):
+def PermitCountsHistAnimation(buildings_ces, figure_dir, kde = True, fmt = 'gif'):
     '''Generate a vintage year based permit frequency count histogram
-    for each unique year in the permit dataset interval.'''
+    for each unique year in the permit dataset interval. All permit
+    year x DAC status x vintage year counts (and optional count scaled
+    KDE curves) are computed once up front, so each frame only updates
+    bar heights and is blitted. Renders headless to a gif or mp4.'''
 
-    def AnimateFunc(num):
-        '''Animation worker function'''
+    hue_order = ['Non-DAC', 'DAC']
+    colors = ['tab:blue', 'tab:orange']
+    bins = np.arange(1900, 2020, 2)
+    centers = (bins[:-1] + bins[1:]) / 2
+    width = np.diff(bins)
+    grid = np.linspace(1900, 2020, 241)
 
-        hue_order = [ 'Non-DAC','DAC']
+    permit_year = buildings_ces['permit_issue_date'].dt.year.to_numpy(dtype = float)
+    vintage_year = buildings_ces['year_built'].dt.year.to_numpy(dtype = float)
+    dac_status = buildings_ces['dac_status'].to_numpy()
 
-        ax.clear()
-        test_years = buildings_ces['permit_issue_date'].dt.year.unique()
-        test_years = np.sort(test_years)
-        y = test_years[num+1]
-        ind = buildings_ces['permit_issue_date'].dt.year == y
-        data = buildings_ces.loc[ind]
-        year = data.loc[:,'year_built'].dt.year
-        data.loc[:,'year_built'] = year.values
+    valid = ~np.isnan(permit_year)
+    years = np.unique(permit_year[valid]).astype(int)
 
-        sns.histplot(x = 'year_built',
-            data = data,
-            hue = 'dac_status',
-            kde = True,
-            legend = True,
-            hue_order = hue_order,
-            ax = ax,
-            bins = np.arange(1900,2020,2))
+    # Bin Counts Cube [permit year, dac status, vintage bin]
+    counts = np.zeros((years.shape[0], len(hue_order), centers.shape[0]))
+    curves = np.zeros((years.shape[0], len(hue_order), grid.shape[0]))
+
+    year_idx = np.searchsorted(years, permit_year)
+    bin_idx = np.digitize(vintage_year, bins) - 1
+
+    for d, status in enumerate(hue_order):
 
-        ax.grid(True)
-        ax.set_title(str(y))
-        ax.set_xlim(1900,2020)
-        ax.set_ylim(0,1500)
-        ax.set_xlabel('Year Built')
-        ax.set_ylabel('Count')
+        ind = valid & (dac_status == status) & ~np.isnan(vintage_year)
+        in_bins = ind & (bin_idx >= 0) & (bin_idx < centers.shape[0])
+        np.add.at(counts[:,d,:], (year_idx[in_bins], bin_idx[in_bins]), 1)
+
+        if kde == True:
+            for y in range(years.shape[0]):
+                sample = vintage_year[ind & (year_idx == y)]
+                if sample.shape[0] > 1 and np.ptp(sample) > 0:
+                    curves[y,d,:] = gaussian_kde(sample)(grid) * sample.shape[0] * width[0]
+
+    # Static Figure Elements
+    fig, ax = plt.subplots(1, 1)
+
+    bars = [ax.bar(centers, counts[0,d], width = width, color = colors[d], alpha = 0.5, label = status, animated = True)
+            for d, status in enumerate(hue_order)]
+    lines = [ax.plot(grid, curves[0,d], color = colors[d], animated = True)[0] for d in range(len(hue_order))] if kde == True else []
+    year_text = ax.text(0.02, 0.95, str(years[0]), transform = ax.transAxes, va = 'top', animated = True)
+
+    ax.legend(title = 'dac_status')
+    ax.grid(True)
+    ax.set_xlim(1900,2020)
+    ax.set_ylim(0,1500)
+    ax.set_xlabel('Year Built')
+    ax.set_ylabel('Count')
 
-        return
+    def AnimateFunc(num):
+        '''Animation worker function'''
 
-    fig = plt.figure()
-    ax = plt.axes()
+        for d in range(len(hue_order)):
+            for rect, h in zip(bars[d], counts[num,d]):
+                rect.set_height(h)
+        for d, line in enumerate(lines):
+            line.set_ydata(curves[num,d])
+        year_text.set_text(str(years[num]))
 
-    numDataPoints = buildings_ces['permit_issue_date'].dt.year.unique().shape[0]-1
+        return [rect for b in bars for rect in b] + lines + [year_text]
 
     line_ani = animation.FuncAnimation(fig,
         AnimateFunc,
-        interval=1000,
-        frames=numDataPoints)
+        interval = 1000,
+        frames = years.shape[0],
+        blit = True)
+
+    fps = years.shape[0] / 16
 
-    plt.show()
+    if fmt == 'mp4':
+        f = figure_dir + 'ladwp_panel_permits_histogram_animation.mp4'
+        writer = animation.FFMpegWriter(fps = fps)
+    else:
+        f = figure_dir + 'ladwp_panel_permits_histogram_animation.gif'
+        writer = animation.PillowWriter(fps = fps)
 
-    f = figure_dir + 'ladwp_panel_permits_histogram_animation.gif'
-    writergif = animation.PillowWriter(fps=numDataPoints/16)
-    line_ani.save(f, writer=writergif)
+    line_ani.save(f, writer = writer)
 
     return
 
@@ -515,7 +568,7 @@ def ExistingPanelRatingsChangeCountsBar(panel_stats_ces_geo, sector, figure_dir)
     '''Function to generate a paired barchart showing the count of homes
     having received upgrades by DAC Status'''
 
-    total_permit_counts = panel_stats_ces_geo.groupby('dac_status')['upgrade_count'].agg('sum').reset_index()
+    total_permit_counts = panel_stats_ces_geo.groupby('dac_status', observed = True)['upgrade_count'].agg('sum').reset_index()
 
     fig, ax = plt.subplots(1,1, figsize=(5,5))
 
@@ -646,13 +699,7 @@ def ExistingPanelRatingsMap(panel_stats_ces_geo, ces4, ladwp, sector, figure_dir
 
     fig, ax = plt.subplots(1,1, figsize=(10,10))
 
-    dac_ind = ces4['ciscorep'] >= 75.0
-    non_dac_ind = ces4['ciscorep'] < 75.0
-
-    ces4.loc[~(dac_ind | non_dac_ind)].boundary.plot(ax = ax, edgecolor = 'k', linewidth = 0.5)
-    ces4.loc[dac_ind].boundary.plot(ax = ax, color = 'tab:orange', linewidth = 0.5)
-    ces4.loc[non_dac_ind].boundary.plot(ax = ax, color = 'tab:blue', linewidth = 0.5)
-    ladwp.boundary.plot(ax = ax, edgecolor = 'black', linewidth = 1.5)
+    DrawBaseMap(ax, ces4, ladwp)
 
     if sector == 'single_family':
         bins = [30,60,100,125,150,200,300,400]
@@ -691,13 +738,7 @@ def ExistingPanelRatingsChangePctMap(panel_stats_ces_geo, ces4, ladwp, figure_di
 
     fig, ax = plt.subplots(1,1, figsize = (10,10))
 
-    dac_ind = ces4['ciscorep'] >= 75.0
-    non_dac_ind = ces4['ciscorep'] < 75.0
-
-    ces4.loc[~(dac_ind | non_dac_ind)].boundary.plot(ax = ax, edgecolor = 'k', linewidth = 0.5)
-    ces4.loc[dac_ind].boundary.plot(ax = ax, color = 'tab:orange', linewidth = 0.5)
-    ces4.loc[non_dac_ind].boundary.plot(ax = ax, color = 'tab:blue', linewidth = 0.5)
-    ladwp.boundary.plot(ax = ax, edgecolor = 'black', linewidth = 1.5)
+    DrawBaseMap(ax, ces4, ladwp)
     panel_stats_ces_geo.plot(column = 'upgrade_delta_pct',
         scheme = 'userdefined',
         k = 7,
@@ -797,21 +838,30 @@ def ExistingPanelRatingsHist(buildings_ces, ces4, ladwp, sector, figure_dir):
 
     return
 
-def JointDistributionPlot(buildings_ces, sector, figure_dir):
+def JointDistributionPlot(buildings_ces, sector, figure_dir, density = 'binned'):
+    '''Construction vintage against building size by DAC status. With
+    density = 'binned' the joint and marginal distributions are drawn as
+    2d / 1d histograms rather than a scatter of every parcel with kde
+    marginals.'''
 
     buildings_ces['log_building_sqft'] = buildings_ces['building_sqft'].apply(np.log10)
 
+    plot_data = buildings_ces.loc[np.isfinite(buildings_ces['log_building_sqft']), ['year_built', 'log_building_sqft', 'dac_status']]
+
+    if density == 'binned':
+        joint_kws = {'kind': 'hist', 'bins': 100, 'marginal_kws': {'bins': 100, 'element': 'step'}}
+    else:
+        joint_kws = {'alpha': 0.1, 'marker': '.', 'linewidth': 0}
+
     if sector == 'single_family':
 
-        fig = sns.jointplot(data = buildings_ces,
+        fig = sns.jointplot(data = plot_data,
             x = 'year_built',
             y = 'log_building_sqft',
             hue = 'dac_status',
             palette = ['tab:blue', 'tab:orange'],
             hue_order = ['Non-DAC', 'DAC'],
-            alpha = 0.1,
-            marker = '.',
-            linewidth = 0
+            **joint_kws
             )
         plt.legend(loc='upper left')
         plt.xlim(pd.to_datetime([1830, 2025], format = '%Y'))
@@ -824,15 +874,13 @@ def JointDistributionPlot(buildings_ces, sector, figure_dir):
 
     elif sector == 'multi_family':
 
-        fig = sns.jointplot(data = buildings_ces,
+        fig = sns.jointplot(data = plot_data,
             x = 'year_built',
             y = 'log_building_sqft',
             hue = 'dac_status',
             palette = ['tab:blue', 'tab:orange'],
             hue_order = ['Non-DAC', 'DAC'],
-            alpha = 0.1,
-            marker = '.',
-            linewidth = 0
+            **joint_kws
             )
         plt.legend(loc='upper left')
         plt.xlim(pd.to_datetime([1860, 2025], format = '%Y'))
@@ -854,13 +902,13 @@ def ExistingPanelRatingsBar(buildings_ces, sector, figure_dir):
 
     # Compute counts
     if sector == 'single_family':
-        counts = buildings_ces.groupby(['dac_status', 'panel_size_existing'])['apn'].agg('count')
+        counts = buildings_ces.groupby(['dac_status', 'panel_size_existing'], observed = True)['apn'].agg('count')
         counts = counts.unstack(level= 0)
         counts.index = counts.index.astype(int)
         ylabel = 'Existing Panel Rating \n[Amps]'
         xlabel = 'Number of Properties'
     elif sector == 'multi_family':
-        counts = buildings_ces.groupby(['dac_status', 'panel_size_existing'])['units'].agg('sum')
+        counts = buildings_ces.groupby(['dac_status', 'panel_size_existing'], observed = True)['units'].agg('sum')
         counts = counts.unstack(level= 0)
         counts.index = counts.index.astype(int)
         ylabel = 'Existing Average Load Center Rating \n[Amps]'
@@ -885,9 +933,118 @@ def ExistingPanelRatingsBar(buildings_ces, sector, figure_dir):
 
     return
 
+#%% Binned Kernel Density Estimates
+
+def BinnedKDE(x, y, bw_method, extent, gridsize = 200):
+    '''Function to estimate a 2d gaussian kernel density on a regular
+    grid by binning the points into a 2d histogram and convolving it
+    with the kernel using an fft. The kernel covariance follows scipy's
+    gaussian_kde with a scalar bw_method. Returns the grid cell centers
+    and the density evaluated at them.'''
+
+    cov = np.cov(np.vstack([x, y])) * bw_method**2
+
+    xedges = np.linspace(extent[0], extent[1], gridsize + 1)
+    yedges = np.linspace(extent[2], extent[3], gridsize + 1)
+    dx = xedges[1] - xedges[0]
+    dy = yedges[1] - yedges[0]
+
+    counts, _, _ = np.histogram2d(x, y, bins = [xedges, yedges])
+
+    # Kernel Truncated at 4 Standard Deviations
+    nx = min(gridsize, int(np.ceil(4 * np.sqrt(cov[0,0]) / dx)))
+    ny = min(gridsize, int(np.ceil(4 * np.sqrt(cov[1,1]) / dy)))
+    ox, oy = np.meshgrid(np.arange(-nx, nx + 1) * dx, np.arange(-ny, ny + 1) * dy, indexing = 'ij')
+    inv = np.linalg.inv(cov)
+    kernel = np.exp(-0.5 * (inv[0,0] * ox**2 + 2 * inv[0,1] * ox * oy + inv[1,1] * oy**2))
+    kernel = kernel / kernel.sum()
+
+    density = np.clip(fftconvolve(counts, kernel, mode = 'same'), 0, None) / (x.shape[0] * dx * dy)
+
+    return (xedges[:-1] + xedges[1:]) / 2, (yedges[:-1] + yedges[1:]) / 2, density
+
+def BinnedKDE1D(v, bw_method, edges):
+    '''Function to estimate a 1d gaussian kernel density on the bins
+    given by edges by convolving a histogram with the kernel.'''
+
+    dv = edges[1] - edges[0]
+    sigma = np.std(v, ddof = 1) * bw_method
+    n = min(edges.shape[0] - 1, int(np.ceil(4 * sigma / dv)))
+
+    counts, _ = np.histogram(v, bins = edges)
+    kernel = np.exp(-0.5 * (np.arange(-n, n + 1) * dv / sigma)**2)
+    kernel = kernel / kernel.sum()
+
+    return np.convolve(counts, kernel, mode = 'same') / (v.shape[0] * dv)
+
+def BinnedKDEJointPlot(data, x, y, hue, palette, bw_method, levels = 10, thresh = 0.05, gridsize = 200):
+    '''Function to draw a hue separated kde jointplot from binned fft
+    kernel density estimates, in place of seaborn's pointwise kde
+    evaluation. Non-finite values (e.g. log10 of zero amps) are
+    dropped. Densities are normalized across hue levels and drawn with
+    common iso-proportion contour levels, as in seaborn's defaults.'''
+
+    finite = np.isfinite(data[x]) & np.isfinite(data[y])
+    data = data.loc[finite]
+
+    xv = data[x].to_numpy(dtype = float)
+    yv = data[y].to_numpy(dtype = float)
+
+    # Common Grid Padded by Three Bandwidths
+    sx = np.std(xv, ddof = 1) * bw_method
+    sy = np.std(yv, ddof = 1) * bw_method
+    extent = (xv.min() - 3 * sx, xv.max() + 3 * sx, yv.min() - 3 * sy, yv.max() + 3 * sy)
+    xedges = np.linspace(extent[0], extent[1], gridsize + 1)
+    yedges = np.linspace(extent[2], extent[3], gridsize + 1)
+
+    hue_levels = np.sort(data[hue].unique())
+    densities = []
+
+    for h in hue_levels:
+        ind = (data[hue] == h).to_numpy()
+        weight = ind.sum() / data.shape[0]
+        if ind.sum() < 2:
+            densities.append(None)
+            continue
+        xc, yc, joint = BinnedKDE(xv[ind], yv[ind], bw_method, extent, gridsize)
+        densities.append((xc, yc, joint * weight,
+                          BinnedKDE1D(xv[ind], bw_method, xedges) * weight,
+                          BinnedKDE1D(yv[ind], bw_method, yedges) * weight))
+
+    # Iso-Proportion Contour Levels
+    values = np.sort(np.concatenate([d[2].ravel() for d in densities if d is not None]))[::-1]
+    normalized = np.cumsum(values) / values.sum()
+    contour_levels = np.take(values, np.searchsorted(normalized, 1 - np.linspace(thresh, 1, levels)), mode = 'clip')
+    contour_levels = np.unique(contour_levels[contour_levels > 0])
+
+    g = sns.JointGrid()
+    handles = []
+
+    for h, d, color in zip(hue_levels, densities, palette):
+        if d is None:
+            continue
+        xc, yc, joint, marg_x, marg_y = d
+        g.ax_joint.contour(xc, yc, joint.T, levels = contour_levels, colors = color, linewidths = 1)
+        g.ax_marg_x.plot(xc, marg_x, color = color)
+        g.ax_marg_x.fill_between(xc, marg_x, color = color, alpha = 0.25)
+        g.ax_marg_y.plot(marg_y, yc, color = color)
+        g.ax_marg_y.fill_betweenx(yc, marg_y, color = color, alpha = 0.25)
+        handles.append(Line2D([0], [0], color = color, label = str(h)))
+
+    g.ax_joint.legend(handles = handles, title = hue)
+    g.ax_joint.set_xlabel(x)
+    g.ax_joint.set_ylabel(y)
+
+    return g
+
 #%% Plot Normalized Amps per Sqft for Upgraded and Non-Upgraded Subsets
 
-def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
+def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir, density = 'binned'):
+    '''Paired DAC / Non-DAC kde jointplots of the existing panel rating per
+    square foot against property size for permitted and non-permitted
+    properties. With density = 'binned' the densities are estimated on a
+    binned grid with BinnedKDEJointPlot, otherwise with seaborn's
+    pointwise kde. Properties with non-finite log ratios are excluded.'''
 
     if sector == 'single_family':
 
@@ -899,20 +1056,30 @@ def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
         non_dacs_ind = buildings_ces['dac_status'] == 'Non-DAC'
         dacs_ind = buildings_ces['dac_status'] == 'DAC'
 
-        non_dacs = buildings_ces.loc[non_dacs_ind,:]
-        dacs = buildings_ces.loc[dacs_ind,:]
+        finite_ind = np.isfinite(buildings_ces['building_sqft_log10']) & np.isfinite(buildings_ces['existing_amps_per_sqft_log10'])
+
+        non_dacs = buildings_ces.loc[non_dacs_ind & finite_ind,:]
+        dacs = buildings_ces.loc[dacs_ind & finite_ind,:]
 
         # Generate SF Plot
 
         bw = 0.75
 
-        fig1 = sns.jointplot(data = non_dacs,
-            x = 'building_sqft_log10',
-            y = 'existing_amps_per_sqft_log10',
-            hue = 'permitted_panel_upgrade',
-            palette = ['lightblue', 'tab:blue'],
-            kind = 'kde',
-            bw_method = bw)
+        if density == 'binned':
+            fig1 = BinnedKDEJointPlot(non_dacs,
+                'building_sqft_log10',
+                'existing_amps_per_sqft_log10',
+                'permitted_panel_upgrade',
+                ['lightblue', 'tab:blue'],
+                bw)
+        else:
+            fig1 = sns.jointplot(data = non_dacs,
+                x = 'building_sqft_log10',
+                y = 'existing_amps_per_sqft_log10',
+                hue = 'permitted_panel_upgrade',
+                palette = ['lightblue', 'tab:blue'],
+                kind = 'kde',
+                bw_method = bw)
 
         upgrade_ind = non_dacs['permitted_panel_upgrade'] == True
         non_upgrade_ind = non_dacs['permitted_panel_upgrade'] == False
@@ -941,16 +1108,24 @@ def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
         fig1.ax_marg_y.set_yticklabels(ytick_labels)
         fig1.ax_joint.set_ylabel('Rated Panel Capacity\n [$Amps / ft^2$]')
 
-        fig2 = sns.jointplot(data = dacs,
-            x = 'building_sqft_log10',
-            y = 'existing_amps_per_sqft_log10',
-            hue = 'permitted_panel_upgrade',
-            palette = ['navajowhite', 'tab:orange'],
-            kind = 'kde',
-            bw_method = bw)
+        if density == 'binned':
+            fig2 = BinnedKDEJointPlot(dacs,
+                'building_sqft_log10',
+                'existing_amps_per_sqft_log10',
+                'permitted_panel_upgrade',
+                ['navajowhite', 'tab:orange'],
+                bw)
+        else:
+            fig2 = sns.jointplot(data = dacs,
+                x = 'building_sqft_log10',
+                y = 'existing_amps_per_sqft_log10',
+                hue = 'permitted_panel_upgrade',
+                palette = ['navajowhite', 'tab:orange'],
+                kind = 'kde',
+                bw_method = bw)
 
         upgrade_ind = dacs['permitted_panel_upgrade'] == True
-        non_upgrade_ind = (dacs['permitted_panel_upgrade'] == False) & ~(np.isinf(dacs['existing_amps_per_sqft_log10']))
+        non_upgrade_ind = dacs['permitted_panel_upgrade'] == False
 
         fig2.ax_joint.axhline(dacs.loc[upgrade_ind, 'existing_amps_per_sqft_log10'].mean(), color = 'tab:orange', linestyle = ':')
         fig2.ax_joint.axvline(dacs.loc[upgrade_ind, 'building_sqft_log10'].mean(), color = 'tab:orange', linestyle = ':')
@@ -974,13 +1149,13 @@ def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
         # Print SF Stats
 
         upgrade_ind = dacs['permitted_panel_upgrade'] == True
-        non_upgrade_ind = (dacs['permitted_panel_upgrade'] == False) & ~(np.isinf(dacs['existing_amps_per_sqft_log10']))
+        non_upgrade_ind = dacs['permitted_panel_upgrade'] == False
 
         print(dacs.loc[upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
         print(dacs.loc[non_upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
 
         upgrade_ind = non_dacs['permitted_panel_upgrade'] == True
-        non_upgrade_ind = (non_dacs['permitted_panel_upgrade'] == False) & ~(np.isinf(non_dacs['existing_amps_per_sqft_log10']))
+        non_upgrade_ind = non_dacs['permitted_panel_upgrade'] == False
 
         print(non_dacs.loc[upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
         print(non_dacs.loc[non_upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
@@ -995,20 +1170,30 @@ def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
         non_dacs_ind = buildings_ces['dac_status'] == 'Non-DAC'
         dacs_ind = buildings_ces['dac_status'] == 'DAC'
 
-        non_dacs = buildings_ces.loc[non_dacs_ind,:]
-        dacs = buildings_ces.loc[dacs_ind,:]
+        finite_ind = np.isfinite(buildings_ces['avg_unit_sqft_log10']) & np.isfinite(buildings_ces['existing_amps_per_sqft_log10'])
+
+        non_dacs = buildings_ces.loc[non_dacs_ind & finite_ind,:]
+        dacs = buildings_ces.loc[dacs_ind & finite_ind,:]
 
         # Generate MF Plots
 
         bw = 0.75
 
-        fig1 = sns.jointplot(data = non_dacs,
-            x = 'avg_unit_sqft_log10',
-            y = 'existing_amps_per_sqft_log10',
-            hue = 'permitted_panel_upgrade',
-            palette = ['lightblue', 'tab:blue'],
-            kind = 'kde',
-            bw_method = bw)
+        if density == 'binned':
+            fig1 = BinnedKDEJointPlot(non_dacs,
+                'avg_unit_sqft_log10',
+                'existing_amps_per_sqft_log10',
+                'permitted_panel_upgrade',
+                ['lightblue', 'tab:blue'],
+                bw)
+        else:
+            fig1 = sns.jointplot(data = non_dacs,
+                x = 'avg_unit_sqft_log10',
+                y = 'existing_amps_per_sqft_log10',
+                hue = 'permitted_panel_upgrade',
+                palette = ['lightblue', 'tab:blue'],
+                kind = 'kde',
+                bw_method = bw)
 
         upgrade_ind = non_dacs['permitted_panel_upgrade'] == True
         non_upgrade_ind = non_dacs['permitted_panel_upgrade'] == False
@@ -1037,16 +1222,24 @@ def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
         fig1.ax_marg_y.set_yticklabels(ytick_labels)
         fig1.ax_joint.set_ylabel('Rated Panel Capacity\n [$Amps / ft^2$]')
 
-        fig2 = sns.jointplot(data = dacs,
-            x = 'avg_unit_sqft_log10',
-            y = 'existing_amps_per_sqft_log10',
-            hue = 'permitted_panel_upgrade',
-            palette = ['navajowhite', 'tab:orange'],
-            kind = 'kde',
-            bw_method = bw)
+        if density == 'binned':
+            fig2 = BinnedKDEJointPlot(dacs,
+                'avg_unit_sqft_log10',
+                'existing_amps_per_sqft_log10',
+                'permitted_panel_upgrade',
+                ['navajowhite', 'tab:orange'],
+                bw)
+        else:
+            fig2 = sns.jointplot(data = dacs,
+                x = 'avg_unit_sqft_log10',
+                y = 'existing_amps_per_sqft_log10',
+                hue = 'permitted_panel_upgrade',
+                palette = ['navajowhite', 'tab:orange'],
+                kind = 'kde',
+                bw_method = bw)
 
         upgrade_ind = dacs['permitted_panel_upgrade'] == True
-        non_upgrade_ind = (dacs['permitted_panel_upgrade'] == False) & ~(np.isinf(dacs['existing_amps_per_sqft_log10']))
+        non_upgrade_ind = dacs['permitted_panel_upgrade'] == False
 
         fig2.ax_joint.axhline(dacs.loc[upgrade_ind, 'existing_amps_per_sqft_log10'].mean(), color = 'tab:orange', linestyle = ':')
         fig2.ax_joint.axvline(dacs.loc[upgrade_ind, 'avg_unit_sqft_log10'].mean(), color = 'tab:orange', linestyle = ':')
@@ -1070,15 +1263,91 @@ def AreaNormalizedComparisonKDE(buildings_ces, sector, figure_dir):
         # Print MF Stats
 
         upgrade_ind = dacs['permitted_panel_upgrade'] == True
-        non_upgrade_ind = (dacs['permitted_panel_upgrade'] == False) & ~(np.isinf(dacs['existing_amps_per_sqft_log10']))
+        non_upgrade_ind = dacs['permitted_panel_upgrade'] == False
 
         print(dacs.loc[upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
         print(dacs.loc[non_upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
 
         upgrade_ind = non_dacs['permitted_panel_upgrade'] == True
-        non_upgrade_ind = (non_dacs['permitted_panel_upgrade'] == False) & ~(np.isinf(non_dacs['existing_amps_per_sqft_log10']))
+        non_upgrade_ind = non_dacs['permitted_panel_upgrade'] == False
 
         print(non_dacs.loc[upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
         print(non_dacs.loc[non_upgrade_ind, 'existing_amps_per_sqft_log10'].mean())
 
     return
+
+#%% Parallel Figure Rendering
+
+# Figure tasks shared copy-on-write with forked rendering workers
+render_state = {}
+
+def RenderWorkerInit():
+    '''Function to switch forked rendering workers to the
+    non-interactive Agg backend.'''
+
+    plt.switch_backend('Agg')
+
+    return
+
+def RenderFigureTask(i):
+    '''Function to render the i-th figure task and return the name of
+    its plot function and the elapsed rendering time in seconds.'''
+
+    func, args = render_state['tasks'][i]
+
+    start = time.perf_counter()
+    func(*args)
+    plt.close('all')
+
+    return func.__name__, time.perf_counter() - start
+
+def ForkAvailable():
+    '''Function to check whether rendering workers can be forked
+    safely. Fork is not used on macOS, where system frameworks can
+    crash forked children, or where the platform does not provide it.'''
+
+    return sys.platform != 'darwin' and 'fork' in multiprocessing.get_all_start_methods()
+
+def RenderFigures(tasks, processes = None):
+    '''Function to render a list of (plot function, argument tuple)
+    figure tasks in a process pool with the Agg backend. Workers are
+    forked after the tasks and base map layers are registered, so the
+    input frames are shared copy-on-write rather than pickled to each
+    worker, and the calling script is never re-imported. Where fork is
+    not available (see ForkAvailable), or processes is 1, the figures
+    are rendered serially in the current process, whose matplotlib
+    backend is restored afterwards. Returns the rendering time of each
+    figure in seconds.'''
+
+    render_state['tasks'] = tasks
+    timings = []
+
+    try:
+
+        if processes == 1 or not ForkAvailable():
+
+            backend = plt.get_backend()
+
+            try:
+                RenderWorkerInit()
+                timings = [RenderFigureTask(i) for i in range(len(tasks))]
+            finally:
+                plt.switch_backend(backend)
+
+        else:
+
+            context = multiprocessing.get_context('fork')
+
+            with ProcessPoolExecutor(max_workers = processes, mp_context = context, initializer = RenderWorkerInit) as executor:
+                timings = list(executor.map(RenderFigureTask, range(len(tasks))))
+
+    finally:
+
+        render_state.clear()
+
+    timings = pd.Series([t for _, t in timings], index = [n for n, _ in timings], name = 'seconds')
+
+    for name, seconds in timings.items():
+        print('{}: {:.1f}s'.format(name, seconds))
+
+    return timings
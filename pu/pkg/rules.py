@@ -0,0 +1,73 @@
+#%% Package Imports
+
+import numpy as np
+import yaml
+import hashlib
+import os
+from functools import lru_cache
+
+#%% Default Rule Table Directory
+
+rules_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rules')
+
+#%% Load and Compile Rule Tables
+
+@lru_cache(maxsize = None)
+def LoadRuleTable(sector, version = 'v1'):
+    '''Function to load the panel rating rule tables for a sector from a
+    versioned yaml rule file and compile them into read-only numpy bin
+    edges and lookup arrays. The version may be either a version name
+    found in the rules directory (e.g. 'v1') or a path to a rule file.
+    Compiled tables are memoized per process and carry the sha256 hash of
+    the rule file so that outputs can record which table produced them.'''
+
+    if os.path.isfile(version):
+        path = version
+    else:
+        path = os.path.join(rules_dir, 'panel_rules_{}.yaml'.format(version))
+
+    with open(path, 'rb') as handle:
+        raw = handle.read()
+
+    tables = yaml.safe_load(raw)
+
+    if sector not in tables:
+        raise Exception("Rule file {} has no tables for sector '{}'".format(path, sector))
+
+    rules = tables[sector]
+    as_built = rules['as_built']
+
+    compiled = {'sector': sector,
+                'version': str(tables['version']),
+                'hash': hashlib.sha256(raw).hexdigest(),
+                'vintage_edges': np.asarray(as_built['vintage_edges'], dtype = float),
+                'size_column': as_built['size_column'],
+                'size_edges': None if as_built['size_edges'] is None else np.asarray(as_built['size_edges'], dtype = float),
+                'panel_sizes': np.asarray(as_built['panel_sizes'], dtype = float),
+                'permit_explicit_amps': np.asarray(rules['permit_explicit_amps'], dtype = float),
+                'permit_assigned_amps': np.asarray(rules['permit_assigned_amps'], dtype = float),
+                'permit_upgrade_scale': np.asarray(rules['permit_upgrade_scale'], dtype = float),
+                'permit_upgrade_floor': float(rules['permit_upgrade_floor']),
+                'inference_upgrade_scale': np.asarray(rules['inference_upgrade_scale'], dtype = float)}
+
+    if compiled['panel_sizes'].shape[0] != compiled['vintage_edges'].shape[0] + 1:
+        raise Exception('Rule table panel_sizes must have one row per vintage bin')
+
+    n_size_bins = 1 if compiled['size_edges'] is None else compiled['size_edges'].shape[0]
+
+    if compiled['panel_sizes'].shape[1] != n_size_bins:
+        raise Exception('Rule table panel_sizes must have one column per size bin')
+
+    for v in compiled.values():
+        if isinstance(v, np.ndarray):
+            v.setflags(write = False)
+
+    return compiled
+
+#%% Rule Table Label
+
+def RuleTableLabel(rules):
+    '''Function to generate a short label identifying the version and hash
+    of the rule table used to produce an output'''
+
+    return '{}:{}'.format(rules['version'], rules['hash'][:12])
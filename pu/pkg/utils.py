@@ -3,36 +3,150 @@
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from tqdm import tqdm
+import os
+import glob
+import json
+import pyarrow.parquet as pq
+
+#%% Buildings Frame Column Schema
+
+# Compact dtypes for the buildings frame, applied after import and
+# kept by the utils and decide functions that add or modify columns
+dac_status_dtype = pd.CategoricalDtype(['DAC', 'Non-DAC'])
+
+buildings_schema = {'city': 'category',
+                    'county_landuse_description': 'category',
+                    'occupancy_status_stnd_code': 'category',
+                    'usetype': 'category',
+                    'usedescription': 'category',
+                    'heating_system_stnd_code': 'category',
+                    'ac_system_stnd_code': 'category',
+                    'permit_type': 'category',
+                    'permit_sub_type': 'category',
+                    'dac_status': dac_status_dtype,
+                    'roll_year': 'Int16',
+                    'roll_landbaseyear': 'Int16',
+                    'roll_impbaseyear': 'Int16',
+                    'panel_related_permit': 'bool',
+                    'permitted_panel_upgrade': 'bool',
+                    'inferred_panel_upgrade': 'bool',
+                    'panel_upgrade': 'bool',
+                    'panel_size_as_built': 'float32',
+                    'panel_size_existing': 'float32',
+                    'upgrade_time_delta': 'float32',
+                    'inferred_upgrade_probability': 'float32',
+                    'rule_table': 'category'}
+
+def ApplyBuildingsSchema(buildings):
+    '''Function to cast the columns of a buildings frame that are
+    present in the schema to their compact dtypes. Missing values in
+    boolean flag columns are treated as False.'''
+
+    for col, dtype in buildings_schema.items():
+
+        if col not in buildings.columns or buildings[col].dtype == dtype:
+            continue
+
+        if dtype == 'bool':
+            buildings[col] = (buildings[col] == True).astype(bool)
+        else:
+            buildings[col] = buildings[col].astype(dtype)
+
+    return buildings
 
 #%% Coalesce Records
 
-def CoalesceRecords(buildings):
+def CoalesceRecords(buildings, agg = None):
+    '''Function to coalesce the duplicate parcel records produced by joining
+    multiple building permits to a single parcel. The first record for each
+    apn is kept and the permit descriptions of all of its records are joined
+    with '; ' in a single grouped aggregation. Aggregation policies for other
+    permit columns can be supplied as a dictionary of column names to groupby
+    aggregations, e.g. {'permit_issue_date': 'max', 'panel_related_permit':
+    'any'}. Columns without a policy keep the value of the first record.'''
 
-    unique_ind = ~buildings['apn'].duplicated()
-    unique_buildings = buildings.loc[unique_ind,:].copy()
+    policy = {'permit_description': 'join'}
 
-    not_unique_ind = ~unique_ind
-    not_unique_buildings = buildings.loc[not_unique_ind,:].copy()
-    not_unique_apns = not_unique_buildings['apn'].unique()
+    if agg is not None:
+        policy.update(agg)
 
-    output = []
+    first_ind = ~buildings['apn'].duplicated()
+    final = buildings.loc[first_ind,:].copy()
 
-    for i in tqdm(range(len(not_unique_apns))):
-        apn = not_unique_apns[i]
-        ind = not_unique_buildings['apn'] == apn
-        sample = not_unique_buildings.loc[ind,:].copy()
-        building = sample.iloc[0].copy()
-        descriptions = sample.loc[:,'permit_description'].copy()
-        description = descriptions.str.cat(sep='; ')
-        building.loc['permit_description'] = description
-        output.append(building)
+    dup_ind = buildings['apn'].duplicated(keep = False)
+    dups = buildings.loc[dup_ind,:]
 
-    output = pd.concat(output, axis = 0)
-    final = pd.concat([unique_buildings, output], axis = 0, ignore_index = True)
+    dup_rows = final['apn'].isin(dups['apn']).to_numpy()
+    dup_apns = final.loc[dup_rows, 'apn']
+
+    for col, func in policy.items():
+
+        if func == 'join':
+            notna = dups[col].notna()
+            values = dups.loc[notna, col].astype(str)
+            grouped = values.groupby(dups.loc[notna, 'apn'].to_numpy(), sort = False).agg('; '.join)
+        else:
+            grouped = dups.groupby('apn', sort = False)[col].agg(func)
+
+        final.loc[dup_rows, col] = dup_apns.map(grouped).to_numpy()
+
+    final.reset_index(inplace = True, drop = True)
 
     return final
 
+#%% Spill Streamed Chunks to Disk
+
+def SpillChunks(chunks, spill_dir, stages = ()):
+    '''Function to push each chunk of a streamed import through a
+    sequence of per-row processing stages (functions taking and
+    returning a buildings frame) and spill the result to a parquet
+    part file in spill_dir, so that peak memory is bounded by the
+    chunk size. Returns the list of part file paths.'''
+
+    os.makedirs(spill_dir, exist_ok = True)
+
+    for path in glob.glob(os.path.join(spill_dir, 'part_*.parquet')):
+        os.remove(path)
+
+    paths = []
+
+    for i, chunk in enumerate(chunks):
+
+        for stage in stages:
+            chunk = stage(chunk)
+
+        path = os.path.join(spill_dir, 'part_{:05d}.parquet'.format(i))
+        chunk.to_parquet(path)
+        paths.append(path)
+
+    return paths
+
+#%% Read Parquet Files
+
+def ReadParquet(path, columns = None):
+    '''Function to read a parquet file written from a frame or a
+    geodataframe. GeoParquet files are read back as geodataframes
+    unless the requested columns exclude the geometry column.'''
+
+    metadata = pq.read_schema(path).metadata or {}
+
+    if b'geo' in metadata:
+        geom_col = json.loads(metadata[b'geo'])['primary_column']
+        if columns is None or geom_col in columns:
+            return gpd.read_parquet(path, columns = columns)
+
+    return pd.read_parquet(path, columns = columns)
+
+#%% Read Spilled Chunks
+
+def ReadSpilledChunks(paths, columns = None):
+    '''Function to read spilled part files back into a single
+    buildings frame, optionally reading only a subset of columns.'''
+
+    buildings = pd.concat([ReadParquet(p, columns = columns) for p in paths], axis = 0, ignore_index = True)
+    buildings = ApplyBuildingsSchema(buildings)
+
+    return buildings
 
 #%% Function Merge Parcels with CES Data
 
@@ -51,9 +165,8 @@ def AssignDACStatus(buildings_ces):
     '''Function to assign DAC status based upon ces composite
     percentile score threshold.'''
 
-    buildings_ces['dac_status'] = 'Non-DAC'
     ind = buildings_ces['ciscorep'] >= 75.0
-    buildings_ces.loc[ind, 'dac_status'] = 'DAC'
+    buildings_ces['dac_status'] = pd.Categorical(np.where(ind, 'DAC', 'Non-DAC'), dtype = dac_status_dtype)
 
     return buildings_ces
 
@@ -133,41 +246,51 @@ def UpgradeTimeDelta(buildings_ces):
     buildings_ces['upgrade_time_delta'] = np.nan
     buildings_ces.loc[upgrade_time_delta.index.get_level_values(0),'upgrade_time_delta'] = upgrade_time_delta.values
 
+    buildings_ces = ApplyBuildingsSchema(buildings_ces)
+
     return buildings_ces
 
-# %% Generate Change Statistics
+#%% Tract Level Aggregate Cube
 
-def ChangeStatistics(buildings_ces, ces4):
-    '''Function to compute relevant statistics about the rate and location of changes
-    in panel sizes from as-built to existing condition.'''
+def TractAggregates(buildings_ces, ces4):
+    '''Function to compute the tract level aggregate cube of parcel
+    counts, mean panel ratings, upgrade counts and permit counts in a
+    single grouped pass and join it once to the ces4 tract geometries.
+    Aggregates of panel columns not yet assigned are omitted. The cube
+    is shared by the tract level statistics and maps.'''
 
-    as_built_mean = buildings_ces.groupby('census_tract')['panel_size_as_built'].agg(['mean'])
-    as_built_mean.columns = ['mean_panel_size_as_built']
+    aggs = {'apn_count': ('apn', 'count'),
+            'properties_count': ('lot_sqft', 'count'),
+            'mean_panel_size_as_built': ('panel_size_as_built', 'mean'),
+            'mean_panel_size_existing': ('panel_size_existing', 'mean'),
+            'upgrade_count': ('panel_upgrade', 'sum'),
+            'permitted_upgrade_count': ('permitted_panel_upgrade', 'sum'),
+            'permit_count': ('panel_related_permit', 'sum')}
+    aggs = {k: v for k, v in aggs.items() if v[0] in buildings_ces.columns}
 
-    sf_property_count = buildings_ces.groupby('census_tract')['lot_sqft'].agg(['count'])
-    sf_property_count.columns = ['properties_count']
+    tract_stats = buildings_ces.groupby('census_tract').agg(**aggs)
+    tract_stats_ces = pd.merge(tract_stats, ces4[['tract', 'ciscorep', 'geom']], left_index = True, right_on = 'tract', how = 'left')
 
-    existing_mean = buildings_ces.groupby('census_tract')['panel_size_existing'].agg(['mean'])
-    existing_mean.columns = ['mean_panel_size_existing']
+    dac_ind = tract_stats_ces['ciscorep'] >= 75.0
+    tract_stats_ces['dac_status'] = pd.Categorical(np.where(dac_ind, 'DAC', 'Non-DAC'), dtype = dac_status_dtype)
 
-    upgrades_count = buildings_ces.groupby('census_tract')['panel_upgrade'].agg('sum')
-    upgrades_count.name = 'upgrade_count'
+    tract_stats_ces = tract_stats_ces.set_index('tract', drop = True)
+    tract_stats_ces_geo = gpd.GeoDataFrame(tract_stats_ces, geometry = 'geom')
 
-    panel_stats = pd.concat([as_built_mean, existing_mean, upgrades_count, sf_property_count], axis = 1)
+    return tract_stats_ces_geo
 
-    panel_stats['upgrade_freq_pct'] = (panel_stats['upgrade_count'] / panel_stats['properties_count']).multiply(100.0)
+# %% Generate Change Statistics
 
-    panel_stats['upgrade_delta_amps'] = panel_stats['mean_panel_size_existing'] - panel_stats['mean_panel_size_as_built']
-    panel_stats['upgrade_delta_pct'] = panel_stats[['mean_panel_size_as_built', 'mean_panel_size_existing']].pct_change(axis = 1).iloc[:,1].multiply(100.0)
+def ChangeStatistics(buildings_ces, ces4):
+    '''Function to compute relevant statistics about the rate and location of changes
+    in panel sizes from as-built to existing condition.'''
 
-    panel_stats_ces = pd.merge(panel_stats, ces4[['tract','ciscorep', 'geom']], left_index = True, right_on = 'tract', how = 'left')
+    panel_stats_ces_geo = TractAggregates(buildings_ces, ces4)
 
-    dac_ind = panel_stats_ces['ciscorep'] >= 75.0
-    panel_stats_ces['dac_status'] = 'Non-DAC'
-    panel_stats_ces.loc[dac_ind, 'dac_status'] = 'DAC'
+    panel_stats_ces_geo['upgrade_freq_pct'] = (panel_stats_ces_geo['upgrade_count'] / panel_stats_ces_geo['properties_count']).multiply(100.0)
 
-    panel_stats_ces = panel_stats_ces.set_index('tract', drop = True)
-    panel_stats_ces_geo = gpd.GeoDataFrame(panel_stats_ces, geometry = 'geom')
+    panel_stats_ces_geo['upgrade_delta_amps'] = panel_stats_ces_geo['mean_panel_size_existing'] - panel_stats_ces_geo['mean_panel_size_as_built']
+    panel_stats_ces_geo['upgrade_delta_pct'] = (panel_stats_ces_geo['upgrade_delta_amps'] / panel_stats_ces_geo['mean_panel_size_as_built']).multiply(100.0)
 
     return panel_stats_ces_geo
 
@@ -189,14 +312,10 @@ def PanelUpgradeDiagnostics(buildings_ces):
     dac_inferred_panel_stats = dac_sample.groupby(['inferred_panel_upgrade'])['census_tract'].agg('count')
     non_dac_inferred_panel_stats = non_dac_sample.groupby(['inferred_panel_upgrade'])['census_tract'].agg('count')
 
-    dac_sample['roll_impbaseyear_int'] = dac_sample.loc[:,'roll_impbaseyear'].dt.year
-    dac_sample.loc[np.isinf(dac_sample['roll_impbaseyear_int']),'roll_impbaseyear_int'] = np.nan
-    dac_imp_year_mean = dac_sample['roll_impbaseyear_int'].mean()
+    dac_imp_year_mean = dac_sample['roll_impbaseyear'].mean()
     dac_vintage_year_mean = dac_sample['year_built'].dt.year.mean()
 
-    non_dac_sample['roll_impbaseyear_int'] = non_dac_sample.loc[:,'roll_impbaseyear'].dt.year
-    non_dac_sample.loc[np.isinf(non_dac_sample['roll_impbaseyear_int']),'roll_impbaseyear_int'] = np.nan
-    non_dac_imp_year_mean = non_dac_sample['roll_impbaseyear_int'].mean()
+    non_dac_imp_year_mean = non_dac_sample['roll_impbaseyear'].mean()
     non_dac_vintage_year_mean = non_dac_sample['year_built'].dt.year.mean()
 
     print('DAC Census Tract Upgrade Stats:')
@@ -324,6 +443,7 @@ def SortColumns(buildings_ces, sector):
             'inferred_panel_upgrade',
             'upgrade_time_delta',
             'panel_size_existing',
+            'rule_table',
             'centroid']
 
     if sector == 'multi_family':
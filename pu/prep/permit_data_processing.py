@@ -2,17 +2,38 @@
 
 import pandas as pd
 import geopandas as gpd
-from sqlalchemy import create_engine
 import os
 
+os.chdir('/Users/edf/repos/la100es-panel-upgrades/pu/')
+
+import pkg.io as io
+
 #%% Set Environment
 
-os.chdir('/Users/edf/gdrive/projects/ladwp_la100_es/analysis/service_panel_upgrades/permit_data/')
+data_dir = '/Users/edf/gdrive/projects/ladwp_la100_es/analysis/service_panel_upgrades/permit_data/'
+staging_path = data_dir + 'la_city_building_permits.parquet'
+date_format = '%m/%d/%Y'
+
+# Explicit dtypes for the text columns used downstream, all other
+# columns are typed by the pyarrow csv reader
+permit_dtypes = {'APN': 'string',
+                 'PERMIT_TYPE': 'category',
+                 'PERMIT_SUB_TYPE': 'category',
+                 'WORK_DESC': 'string',
+                 'LAT': 'float64',
+                 'LON': 'float64'}
+
+date_cols = ['SUBMITTED_DATE', 'ISSUE_DATE', 'COFO_DATE']
+
+# Set incremental to upsert only permits issued or submitted since the
+# last load, keyed on the permit number, instead of replacing the table
+incremental = False
+permit_key = 'PCIS_PERMIT'
 
 #%% Read Data
 
-pre_2010 = pd.read_csv('City_LosAngeles_ElecBefore2010.csv', low_memory = False)
-post_2010 = pd.read_csv('City_LosAngeles_ElecAfter2010.csv', low_memory = False)
+pre_2010 = pd.read_csv(data_dir + 'City_LosAngeles_ElecBefore2010.csv', engine = 'pyarrow', dtype = permit_dtypes)
+post_2010 = pd.read_csv(data_dir + 'City_LosAngeles_ElecAfter2010.csv', engine = 'pyarrow', dtype = permit_dtypes)
 
 #%% Concatenate Tables
 
@@ -20,9 +41,10 @@ all_permits = pd.concat([pre_2010, post_2010], axis = 0, ignore_index = True)
 
 #%% Format Columns
 
-all_permits['SUBMITTED_DATE'] = pd.to_datetime(all_permits['SUBMITTED_DATE'])
-all_permits['ISSUE_DATE'] = pd.to_datetime(all_permits['ISSUE_DATE'])
-all_permits['COFO_DATE'] = pd.to_datetime(all_permits['COFO_DATE'])
+# Raise on any value that does not match date_format rather than
+# coercing it to NaT, which would corrupt the ISSUE_DATE watermark
+for c in date_cols:
+    all_permits[c] = pd.to_datetime(all_permits[c], format = date_format, errors = 'raise')
 
 #%% Create GeoDataFrame
 
@@ -35,14 +57,38 @@ all_permits_gdf = gpd.GeoDataFrame(
 all_permits_gdf = all_permits_gdf.set_crs(4326)
 all_permits_gdf = all_permits_gdf.to_crs(3310)
 
+#%% Write GeoParquet Staging File
+
+all_permits_gdf.to_parquet(staging_path)
+
 #%% Test Plot
 
 all_permits_gdf.plot()
 
 #%% Import to Database
 
-engine = create_engine("postgresql://edf@localhost:5432/edf")  
-all_permits_gdf.to_postgis(schema = 'la100es', 
-    name = 'la_city_building_permits', 
-    con = engine,
-    if_exists = 'replace')  
+all_permits_gdf = gpd.read_parquet(staging_path)
+
+# Fall Back to a Full Load if No Permits Have Been Loaded Yet
+if incremental == True:
+    issue_watermark, submitted_watermark = io.PermitWatermark()
+    incremental = issue_watermark is not None or submitted_watermark is not None
+
+if incremental == True:
+
+    new_ind = pd.Series(False, index = all_permits_gdf.index)
+    if issue_watermark is not None:
+        new_ind = new_ind | (all_permits_gdf['ISSUE_DATE'] >= issue_watermark)
+    if submitted_watermark is not None:
+        new_ind = new_ind | (all_permits_gdf['SUBMITTED_DATE'] >= submitted_watermark)
+    io.UpsertPermitData(all_permits_gdf.loc[new_ind], permit_key)
+
+else:
+
+    io.ExportFrame(all_permits_gdf,
+        'la_city_building_permits',
+        schema = 'la100es',
+        geom_col = 'geometry',
+        indexes = ['APN'])
+
+io.DisposeEngine()
@@ -0,0 +1,99 @@
+-- Incremental refresh of la100es.panel_data_permits for the parcels listed in
+-- the temporary table permit_refresh_apns, i.e. parcels with new or changed building permits.
+-- Mirrors the permit join, renames and casts in service_panel_data_creation.sql.
+-- Downstream panel assignments are not updated; rerun the sector scripts for those.
+
+-- Remove existing records for affected parcels
+
+DELETE FROM la100es.panel_data_permits
+WHERE "ain" IN (SELECT "APN" FROM permit_refresh_apns);
+
+-- Rebuild records for affected parcels from the permit database
+
+INSERT INTO la100es.panel_data_permits (
+		"ztrax_rowid",
+		"apn",
+		"buildings",
+		"lot_sqft",
+		"county_landuse_description",
+		"occupancy_status_stnd_code",
+		"year_built",
+		"units",
+		"bedrooms",
+		"bathrooms",
+		"heating_system_stnd_code",
+		"ac_system_stnd_code",
+		"building_sqft",
+		"centroid",
+		"census_tract",
+		"ain",
+		"usetype",
+		"usedescription",
+		"roll_year",
+		"roll_landvalue",
+		"roll_landbaseyear",
+		"roll_impvalue",
+		"roll_impbaseyear",
+		"city",
+		"permit_type",
+		"permit_sub_type",
+		"permit_description",
+		"permit_issue_date")
+SELECT 	A."RowID",
+		A."AssessorParcelNumber",
+		A."NoOfBuildings"::INT4,
+		A."LotSizeSquareFeet"::INT8,
+		A."PropertyCountyLandUseDescription",
+		A."OccupancyStatusStndCode",
+		TO_DATE(A."YearBuilt"::VARCHAR, 'YYYY'),
+		A."NoOfUnits"::INT4,
+		A."TotalBedrooms"::INT4,
+		A."TotalActualBathCount"::INT4,
+		A."HeatingTypeorSystemStndCode",
+		A."AirConditioningTypeorSystemStndCode",
+		A."BuildingAreaSqFt",
+		A."centroid",
+		A."census_tract",
+		A."ain",
+		A."usetype",
+		A."usedescription",
+		TO_DATE(A."roll_year", 'YYYY'),
+		A."roll_landvalue",
+		TO_DATE(A."roll_landbaseyear", 'YYYY'),
+		A."roll_impvalue",
+		TO_DATE(A."roll_impbaseyear", 'YYYY'),
+		A."city",
+		B."PERMIT_TYPE",
+		B."PERMIT_SUB_TYPE",
+		B."WORK_DESC",
+		B."ISSUE_DATE"
+FROM la100es.panel_data AS A 
+LEFT JOIN la100es.la_city_building_permits AS B
+ON A."ain" = B."APN"
+WHERE A."ain" IN (SELECT "APN" FROM permit_refresh_apns);
+
+-- Determine where panel upgrades occurred based upon permit description
+
+UPDATE la100es.panel_data_permits
+SET panel_related_permit = ("permit_description" ~* 'UPGRADE' OR
+	  "permit_description" ~* 'MAIN' OR
+	  "permit_description" ~* 'PANEL' OR
+	  "permit_description" ~* 'SERVICE' OR 
+	  "permit_description" ~* 'AMP' OR 
+	  "permit_description" ~* 'SOLAR' OR
+	  "permit_description" ~* 'PV' OR
+	  "permit_description" ~* 'PHOTOVOLTAIC' OR
+	  "permit_description" ~* 'EV CHARGER' OR
+	  "permit_description" ~* 'AC ' OR
+	  "permit_description" ~* 'A/C' OR 
+	  "permit_description" ~* 'AIR CONDITIONER' OR
+	  "permit_description" ~* 'HEAT PUMP') IS TRUE
+WHERE "ain" IN (SELECT "APN" FROM permit_refresh_apns);
+
+-- Add physical geography fields from the elevation tile containing each centroid
+
+UPDATE la100es.panel_data_permits
+SET elevation_m = ST_VALUE(R.rast, centroid)
+FROM srtm.ca_elevation AS R
+WHERE "ain" IN (SELECT "APN" FROM permit_refresh_apns) AND
+	  ST_Intersects(R.rast, centroid);
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The analysis package is imported as pkg from the pu directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pu'))
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkg import decide
+
+#%% Draw Upgrade Decisions
+
+def test_draw_upgrade_decisions_matches_legacy_choice_loop():
+
+    probabilities = np.concatenate([[0.0, 1.0, 0.5], np.random.default_rng(7).random(500)])
+
+    np.random.seed(12345678)
+    legacy = np.array([np.random.choice(np.array([False, True]), size = 1, p = [1.0-pr, pr])[0] for pr in probabilities])
+
+    np.random.seed(12345678)
+    upgrade = decide.DrawUpgradeDecisions(probabilities)
+
+    np.testing.assert_array_equal(upgrade, legacy)
+
+def test_draw_upgrade_decisions_with_generator():
+
+    probabilities = np.array([0.0, 1.0, 0.0, 1.0])
+    upgrade = decide.DrawUpgradeDecisions(probabilities, rng = np.random.default_rng(1))
+
+    np.testing.assert_array_equal(upgrade, [False, True, False, True])
+
+#%% Parse Permit Descriptions
+
+amps = (100, 125, 150, 200, 225, 320, 400, 600)
+
+def test_permit_pattern_is_cached_per_amps():
+
+    assert decide.PermitPattern(amps) is decide.PermitPattern(amps)
+
+def test_parse_permit_descriptions_amps_tokens():
+
+    descriptions = pd.Series(['UPGRADE 200 AMP PANEL',
+                              '125 AMP SERVICE',
+                              '120V CIRCUIT',
+                              'ADDITION 1000 SQFT',
+                              'REPLACE 100A MAIN WITH 200 AMP',
+                              None])
+
+    permits = decide.ParsePermitDescriptions(descriptions, amps)
+
+    assert permits['amps'].tolist() == [200, 125, 0, 0, 200, 0]
+    assert permits['amps_125'].tolist() == [False, True, False, False, False, False]
+    assert permits['amps_100'].tolist() == [False, False, False, False, True, False]
+    assert permits.index.equals(descriptions.index)
+
+def test_parse_permit_descriptions_equipment_flags():
+
+    descriptions = pd.Series(['INSTALL ROOF MOUNTED SOLAR',
+                              'NEW PV SYSTEM',
+                              'PHOTOVOLTAIC',
+                              'LEVEL 2 EV CHARGER',
+                              'REPLACE A/C CONDENSER',
+                              'REPLACE WATER HEATER'],
+                             index = [10, 11, 12, 13, 14, 15])
+
+    permits = decide.ParsePermitDescriptions(descriptions, amps)
+
+    assert permits['solar'].tolist() == [True, True, True, False, False, False]
+    assert permits['ev'].tolist() == [False, False, False, True, False, False]
+    assert permits['ac'].tolist() == [False, False, False, False, True, False]
+
+#%% Next Upgrade Tier
+
+def test_next_upgrade_tier_steps_up_one_tier():
+
+    scale = [0., 40., 60., 90., 150., 200.]
+    stepped = decide.NextUpgradeTier(np.array([0., 60., 150., np.nan, 200.]), scale)
+
+    np.testing.assert_array_equal(stepped, [40., 90., 200., np.nan, np.nan])
+
+def test_next_upgrade_tier_rejects_sizes_off_the_scale():
+
+    with pytest.raises(Exception, match = 'not on the upgrade scale'):
+        decide.NextUpgradeTier(np.array([100., 125.]), [0., 100., 200.])
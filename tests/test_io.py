@@ -0,0 +1,101 @@
+import glob
+import os
+import re
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkg import io
+
+#%% Building Permit Query
+
+def SelectedColumns(buildings_sql):
+
+    # Outermost select list, which follows the last SELECT
+    select = buildings_sql.rsplit('SELECT', 1)[1].replace('DISTINCT ON (A."apn")', '')
+    select = re.split(r'\n\s*FROM\s', select)[0]
+    names = []
+
+    for expression in select.split(','):
+        alias = re.search(r'AS "(\w+)"\s*$', expression.strip())
+        names.append(alias.group(1) if alias else re.search(r'"(\w+)"\s*$', expression.strip()).group(1))
+
+    return names
+
+@pytest.mark.parametrize('sector', ['single_family', 'multi_family'])
+def test_building_permit_query_coalesce_selects_same_columns(sector):
+
+    flat = io.BuildingPermitQuery(sector, coalesce = False)
+    coalesced = io.BuildingPermitQuery(sector, coalesce = True)
+
+    assert SelectedColumns(flat) == io.buildings_columns
+    assert SelectedColumns(coalesced) == io.buildings_columns
+
+@pytest.mark.parametrize('sector', ['single_family', 'multi_family'])
+def test_building_permit_query_coalesce_matches_coalesce_records(sector):
+
+    coalesced = io.BuildingPermitQuery(sector, coalesce = True)
+
+    # One record per apn, descriptions joined with '; ' as in utils.CoalesceRecords
+    assert 'SELECT DISTINCT ON (A."apn")' in coalesced
+    assert '''string_agg("permit_description", '; ' ORDER BY "permit_issue_date", "ztrax_rowid")''' in coalesced
+    assert 'ORDER BY    A."apn", A."permit_issue_date", A."ztrax_rowid"' in coalesced
+    assert io.buildings_sector_filters[sector] in coalesced
+
+    # Sentinel dates are nulled in the same way as the flat query
+    for c in io.buildings_date_columns + io.buildings_year_columns:
+        assert io.BuildingPermitColumn(c, 'A.') in coalesced
+        assert io.BuildingPermitColumn(c) in io.BuildingPermitQuery(sector)
+
+def test_building_permit_query_rejects_unknown_sector():
+
+    with pytest.raises(Exception):
+        io.BuildingPermitQuery('commercial')
+
+#%% Partitioned GeoParquet Output
+
+def test_partition_directory_names():
+
+    assert io.PartitionDirectory('dac_status', 'DAC') == 'dac_status=DAC'
+    assert io.PartitionDirectory('census_tract', 6037101110.0) == 'census_tract=6037101110'
+    assert io.PartitionDirectory('census_tract', 6037101110.5) == 'census_tract=6037101110.5'
+    assert io.PartitionDirectory('census_tract', np.nan) == 'census_tract=__HIVE_DEFAULT_PARTITION__'
+    assert io.PartitionDirectory('dac_status', None) == 'dac_status=__HIVE_DEFAULT_PARTITION__'
+
+def BuildingsFrame():
+
+    buildings = pd.DataFrame({'apn': ['1', '2', '3', '4', '5'],
+                              'census_tract': [6037000200.0, 6037000100.0, 6037000200.0, np.nan, 6037000100.0],
+                              'dac_status': pd.Categorical(['DAC', 'Non-DAC', 'Non-DAC', 'DAC', 'DAC'], categories = ['Non-DAC', 'DAC']),
+                              'panel_size_existing': np.array([100, 200, 150, 100, 200], dtype = np.float32)})
+
+    return gpd.GeoDataFrame(buildings, geometry = gpd.points_from_xy(np.arange(5.), np.arange(5.)), crs = 'EPSG:3310').rename_geometry('centroid')
+
+@pytest.mark.parametrize('partition_cols', [['dac_status'], ['census_tract']])
+def test_write_buildings_geoparquet_round_trip(tmp_path, partition_cols):
+
+    buildings = BuildingsFrame()
+    path = io.WriteBuildingsGeoParquet(buildings, str(tmp_path / 'buildings.parquet'), partition_cols = partition_cols)
+
+    parts = []
+
+    for part_path in glob.glob(os.path.join(path, '*', 'part-0.parquet')):
+        part = gpd.read_parquet(part_path)
+        if 'census_tract' in part.columns:
+            assert part['census_tract'].dropna().is_monotonic_increasing
+        part[partition_cols[0]] = os.path.basename(os.path.dirname(part_path)).split('=')[1]
+        parts.append(part)
+
+    written = pd.concat(parts).sort_values('apn').reset_index(drop = True)
+
+    assert written['apn'].tolist() == buildings['apn'].tolist()
+    assert written.crs == buildings.crs
+    assert written['centroid'].equals(buildings['centroid'])
+    np.testing.assert_array_equal(written['panel_size_existing'], buildings['panel_size_existing'])
+
+    if partition_cols == ['census_tract']:
+        assert written['census_tract'].tolist() == ['6037000200', '6037000100', '6037000200', '__HIVE_DEFAULT_PARTITION__', '6037000100']
+    else:
+        assert written['dac_status'].tolist() == buildings['dac_status'].astype(str).tolist()
@@ -0,0 +1,36 @@
+import pandas as pd
+
+from pkg import utils
+
+#%% Coalesce Records
+
+def PermitRecords():
+
+    return pd.DataFrame({'apn': ['A', 'B', 'A', 'C', 'A', 'C'],
+                         'permit_description': ['SOLAR', 'PANEL', '200 AMP', None, 'EV CHARGER', 'A/C'],
+                         'permit_issue_date': pd.to_datetime(['2015-01-01', '2016-01-01', '2018-01-01',
+                                                              '2017-01-01', '2012-01-01', '2019-01-01']),
+                         'panel_related_permit': [False, True, True, False, False, True]})
+
+def test_coalesce_records_keeps_first_record_and_joins_descriptions():
+
+    final = utils.CoalesceRecords(PermitRecords())
+
+    assert final['apn'].tolist() == ['A', 'B', 'C']
+    assert final['permit_description'].tolist() == ['SOLAR; 200 AMP; EV CHARGER', 'PANEL', 'A/C']
+    assert final['permit_issue_date'].tolist() == list(pd.to_datetime(['2015-01-01', '2016-01-01', '2017-01-01']))
+    assert final['panel_related_permit'].tolist() == [False, True, False]
+    assert final.index.equals(pd.RangeIndex(3))
+
+def test_coalesce_records_aggregation_policies():
+
+    final = utils.CoalesceRecords(PermitRecords(), agg = {'permit_issue_date': 'max', 'panel_related_permit': 'any'})
+
+    assert final['permit_issue_date'].tolist() == list(pd.to_datetime(['2018-01-01', '2016-01-01', '2019-01-01']))
+    assert final['panel_related_permit'].tolist() == [True, True, True]
+
+def test_coalesce_records_without_duplicates_is_unchanged():
+
+    records = PermitRecords().drop_duplicates('apn').reset_index(drop = True)
+
+    pd.testing.assert_frame_equal(utils.CoalesceRecords(records), records)